@@ -1,8 +1,10 @@
-from flask import Flask, request, abort
+from flask import Flask, request, abort, jsonify
 import json
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from jwks import JWKSKeyStore, JWKSUnavailable, url_provider
+from token_cache import VerifiedTokenCache
 
 
 app = Flask(__name__)
@@ -11,6 +13,9 @@ AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
 
+jwks = JWKSKeyStore(url_provider(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'))
+verified_tokens = VerifiedTokenCache()
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -22,13 +27,14 @@ def get_token_auth_header():
     """Obtains the Access Token from the Authorization Header
     """
     auth = request.headers.get('Authorization', None)
-    if not auth:
+    # a header of whitespace only counts as missing
+    parts = auth.split() if auth else []
+    if not parts:
         raise AuthError({
             'code': 'authorization_header_missing',
             'description': 'Authorization header is expected.'
         }, 401)
 
-    parts = auth.split()
     if parts[0].lower() != 'bearer':
         raise AuthError({
             'code': 'invalid_header',
@@ -52,25 +58,20 @@ def get_token_auth_header():
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    try:
+        rsa_key = jwks.get_key(unverified_header['kid'])
+    except JWKSUnavailable:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the keys to verify the token.'
+        }, 503)
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -110,13 +111,21 @@ def requires_auth(f):
     def wrapper(*args, **kwargs):
         token = get_token_auth_header()
         try:
-            payload = verify_decode_jwt(token)
-        except:
+            payload = verified_tokens.verify(token, verify_decode_jwt)
+        except AuthError:
+            # keeps its status, e.g. the 503 when the keys cannot be fetched
+            raise
+        except Exception:
             abort(401)
         return f(payload, *args, **kwargs)
 
     return wrapper
 
+@app.errorhandler(AuthError)
+def auth_error(error):
+    return jsonify(error.error), error.status_code
+
+
 @app.route('/headers')
 @requires_auth
 def headers(payload):
@@ -0,0 +1,63 @@
+"""Checks that modules shared between projects have not drifted apart.
+
+Each project is deployed on its own, so a few modules are copied between them
+rather than imported. Every copy must match its canonical module except for
+the module docstring, which may adapt examples to its project:
+
+    $ python check_shared_modules.py
+
+exits with status 1 and prints a diff for each copy that differs.
+"""
+import ast
+import difflib
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+# canonical module -> its copies
+SHARED_MODULES = {
+    'projects/01_fyyur/starter_code/query_stats.py': [
+        'projects/02_trivia_api/starter/backend/query_stats.py',
+        'projects/03_coffee_shop_full_stack/starter_code/backend/src/query_stats.py',
+    ],
+    'projects/03_coffee_shop_full_stack/starter_code/backend/src/auth/jwks.py': [
+        'BasicFlaskAuth/jwks.py',
+    ],
+    'projects/03_coffee_shop_full_stack/starter_code/backend/src/auth/token_cache.py': [
+        'BasicFlaskAuth/token_cache.py',
+    ],
+    'projects/02_trivia_api/starter/backend/flaskr/caching.py': [
+        'projects/03_coffee_shop_full_stack/starter_code/backend/src/caching.py',
+    ],
+}
+
+
+def code_lines(path):
+    """The lines of the module at ``path`` after its docstring."""
+    source = (ROOT / path).read_text()
+    body = ast.parse(source).body
+    start = 0
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+            and isinstance(body[0].value.value, str):
+        start = body[0].end_lineno
+    return source.splitlines(keepends=True)[start:]
+
+
+def drifted():
+    """Yields ``(canonical, copy, diff)`` for every copy whose code differs from its canonical module."""
+    for canonical, copies in SHARED_MODULES.items():
+        expected = code_lines(canonical)
+        for copy in copies:
+            diff = list(difflib.unified_diff(expected, code_lines(copy), canonical, copy))
+            if diff:
+                yield canonical, copy, diff
+
+
+if __name__ == '__main__':
+    failed = False
+    for canonical, copy, diff in drifted():
+        failed = True
+        print(f'{copy} differs from {canonical}:')
+        sys.stdout.writelines(diff)
+    sys.exit(1 if failed else 0)
@@ -3,9 +3,10 @@
 # ----------------------------------------------------------------------------#
 
 import json
-import dateutil.parser
-from babel import dates
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import base64
+from itertools import groupby
+import click
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -13,6 +14,9 @@ import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from search import RankedSearch
+from formatting import format_datetime
+from query_stats import QueryStats
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -23,14 +27,48 @@ moment = Moment(app)
 app.config.from_object('config')
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
+query_stats = QueryStats(app)
 
 
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
 
+# Genre lookups go genre -> venues/artists, hence the (genre_id, owner_id) indexes.
+venue_genre = db.Table(
+    'venue_genre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_venue_genre_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+
+artist_genre = db.Table(
+    'artist_genre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_artist_genre_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
+
+
+class Genre(db.Model):
+    __tablename__ = 'genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @classmethod
+    def named(cls, names):
+        """The genres with the given names, creating the ones that do not exist yet."""
+        names = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+        existing = {genre.name: genre for genre in cls.query.filter(cls.name.in_(names))} if names else {}
+        return [existing.get(name) or cls(name=name) for name in names]
+
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -42,7 +80,7 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120))
 
     # TODO: (done) implement any missing fields, as a database migration using Flask-Migrate
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=venue_genre, order_by=Genre.name)
     website = db.Column(db.String())
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String())
@@ -50,18 +88,23 @@ class Venue(db.Model):
 
     def json(self):
         column_names = [c.name for c in self.__table__.columns]
-        return {name: getattr(self, name) for name in column_names}
+        data = {name: getattr(self, name) for name in column_names}
+        data['genres'] = [genre.name for genre in self.genres]
+        return data
 
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genre, order_by=Genre.name)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
 
@@ -73,13 +116,21 @@ class Artist(db.Model):
 
     def json(self):
         column_names = [c.name for c in self.__table__.columns]
-        return {name: getattr(self, name) for name in column_names}
+        data = {name: getattr(self, name) for name in column_names}
+        data['genres'] = [genre.name for genre in self.genres]
+        return data
 
 
 # TODO (done) Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
 class Show(db.Model):
     __tablename__ = 'show'
+    __table_args__ = (
+        # the primary key already covers (artist_id, venue_id, start_time) lookups by artist
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        # keyset pagination order of the /shows listing
+        db.Index('ix_show_start_time_artist_id_venue_id', 'start_time', 'artist_id', 'venue_id'),
+    )
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
     start_time = db.Column(db.DateTime, primary_key=True)
@@ -89,7 +140,7 @@ class Show(db.Model):
             "artist_id": self.artist_id,
             "artist_name": self.artist.name,
             "artist_image_link": self.artist.image_link,
-            "start_time": self.start_time.isoformat(),
+            "start_time": self.start_time,
         }
 
     def json_venue(self):
@@ -97,7 +148,7 @@ class Show(db.Model):
             "venue_id": self.venue_id,
             "venue_name": self.venue.name,
             "venue_image_link": self.venue.image_link,
-            "start_time": self.start_time.isoformat(),
+            "start_time": self.start_time,
         }
 
     def json(self):
@@ -107,22 +158,116 @@ class Show(db.Model):
             "artist_id": self.artist_id,
             "artist_name": self.artist.name,
             "artist_image_link": self.artist.image_link,
-            "start_time": self.start_time.isoformat()
+            "start_time": self.start_time
         }
 
+
 # ----------------------------------------------------------------------------#
-# Filters.
+# Queries.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return dates.format_datetime(date, format, locale='en_US')
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+SEARCH_LIMIT = 50
+
+venue_search = RankedSearch(db, Venue)
+artist_search = RankedSearch(db, Artist)
+
+
+def venue_directory(now=None, genre=None):
+    """Venues grouped by (city, state) with their number of upcoming shows.
+
+    Everything comes from a single grouped statement, however many venues there are.
+    """
+    now = now or datetime.now()
+    num_upcoming_shows = db.func.count(Show.start_time)
+    query = db.session.query(Venue.city, Venue.state, Venue.id, Venue.name, num_upcoming_shows)
+    if genre:
+        query = query.join(Venue.genres).filter(Genre.name == genre)
+    rows = query \
+        .outerjoin(Show, db.and_(Show.venue_id == Venue.id, Show.start_time > now)) \
+        .group_by(Venue.city, Venue.state, Venue.id, Venue.name) \
+        .order_by(Venue.state, Venue.city, Venue.id) \
+        .all()
+
+    areas = []
+    for (city, state), venues in groupby(rows, key=lambda row: (row[0], row[1])):
+        areas.append({
+            'city': city,
+            'state': state,
+            'venues': [{
+                'id': venue_id,
+                'name': name,
+                'num_upcoming_shows': upcoming,
+            } for _, _, venue_id, name, upcoming in venues],
+        })
+    return areas
+
+
+def past_and_upcoming_shows(owner_column, owner_id, related, now=None):
+    """Shows of one venue or artist, split into past and upcoming by the database.
 
+    ``related`` (``Show.artist`` or ``Show.venue``) is loaded in the same statement,
+    so serializing the shows never goes back to the database.
+    """
+    now = now or datetime.now()
+    shows = Show.query.options(db.joinedload(related)).filter(owner_column == owner_id)
+    past_shows = shows.filter(Show.start_time <= now).order_by(Show.start_time).all()
+    upcoming_shows = shows.filter(Show.start_time > now).order_by(Show.start_time).all()
+    return past_shows, upcoming_shows
 
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, columns):
+    """Turns a cursor back into key values for ``columns``; raises ValueError if it is malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor {cursor!r}') from e
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError(f'Invalid cursor {cursor!r}')
+    return [decode_cursor_value(cursor, column, value) for column, value in zip(columns, values)]
+
+
+def decode_cursor_value(cursor, column, value):
+    if isinstance(column.type, db.DateTime):
+        if not isinstance(value, str):
+            raise ValueError(f'Invalid cursor {cursor!r}')
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, db.Integer):
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError(f'Invalid cursor {cursor!r}')
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f'Invalid cursor {cursor!r}')
+    return value
+
+
+def keyset_page(query, columns, cursor=None, limit=PAGE_SIZE):
+    """One page of ``query`` ordered by ``columns``, starting right after ``cursor``.
+
+    Seeks on the (indexed) key instead of using OFFSET, so every page costs the same
+    however deep it is. Returns the rows and the cursor of the next page, if any.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        query = query.filter(db.tuple_(*columns) > db.tuple_(*decode_cursor(cursor, columns)))
+    rows = query.order_by(*columns).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
+
+# ----------------------------------------------------------------------------#
+# Filters.
+# ----------------------------------------------------------------------------#
+
+# Takes an optional locale, e.g. {{ show.start_time|datetime('full', 'fr_FR') }}
 app.jinja_env.filters['datetime'] = format_datetime
 
 
@@ -139,26 +284,11 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@QueryStats.budget(1)
 def venues():
     # TODO: (done) replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
-    venues = Venue.query.all()
-    areas = {}
-    for venue in venues:
-        area = venue.city, venue.state
-        venue_json = {'id': venue.id, 'name': venue.name}
-        if area in areas:
-            areas[area].append(venue_json)
-        else:
-            areas[area] = [venue_json]
-    data = []
-    for area in areas:
-        data.append({
-            'city': area[0],
-            'state': area[1],
-            'venues': areas[area],
-        })
-    return render_template('pages/venues.html', areas=data)
+    return render_template('pages/venues.html', areas=venue_directory(genre=request.args.get('genre')))
 
 
 @app.route('/venues/search', methods=['POST'])
@@ -167,34 +297,26 @@ def search_venues():
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
     search_term = request.form.get('search_term', '')
-    venues = Venue.query.filter(Venue.name.ilike(f'%{search_term.lower()}%'))
+    count, venues = venue_search.search(search_term, limit=SEARCH_LIMIT)
     response = {
-        "count": venues.count(),
-        "data": [{
-            "id": venue.id,
-            "name": venue.name,
-        } for venue in venues]
+        "count": count,
+        "data": venues
     }
     return render_template('pages/search_venues.html', results=response,
                            search_term=search_term)
 
 
 @app.route('/venues/<int:venue_id>')
+@QueryStats.budget(3)
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # TODO: (done) replace with real venue data from the venues table, using venue_id
-    venue = Venue.query.get(venue_id)
-    venue_shows = venue.shows
-    past_shows = []
-    upcoming_shows = []
-    for show in venue_shows:
-        if show.start_time < datetime.now():
-            past_shows.append(show.json_artist())
-        else:
-            upcoming_shows.append(show.json_artist())
+    venue = Venue.query.options(db.joinedload(Venue.genres)).get(venue_id)
+    past_shows, upcoming_shows = past_and_upcoming_shows(Show.venue_id, venue_id, Show.artist)
+    past_shows = [show.json_artist() for show in past_shows]
+    upcoming_shows = [show.json_artist() for show in upcoming_shows]
 
     venue_json = venue.json()
-    venue_json['genres'] = venue_json['genres'].split(',')
     venue_json['past_shows_count'] = len(past_shows)
     venue_json['upcoming_shows_count'] = len(upcoming_shows)
     venue_json['past_shows'] = past_shows
@@ -216,8 +338,8 @@ def create_venue_form():
 def create_venue_submission():
     try:
         # TODO: (done) insert form data as a new Venue record in the db, instead
-        new_venue = Venue(**request.form)
-        new_venue.genres = ','.join(request.form.getlist('genres'))
+        new_venue = Venue(**{key: value for key, value in request.form.items() if key != 'genres'})
+        new_venue.genres = Genre.named(request.form.getlist('genres'))
         new_venue.seeking_talent = bool(request.form.get('seeking_talent', None))
         # TODO: (done) modify data to be the data object returned from db insertion
         db.session.add(new_venue)
@@ -253,10 +375,20 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@QueryStats.budget(1)
 def artists():
     # TODO: (done) replace with real data returned from querying the database
-    data = Artist.query.all()
-    return render_template('pages/artists.html', artists=data)
+    artists = Artist.query
+    genre = request.args.get('genre')
+    if genre:
+        artists = artists.join(Artist.genres).filter(Genre.name == genre)
+    try:
+        data, next_cursor = keyset_page(artists, (Artist.id,),
+                                        request.args.get('cursor'),
+                                        request.args.get('limit', PAGE_SIZE, type=int))
+    except ValueError:
+        abort(400)
+    return render_template('pages/artists.html', artists=data, next_cursor=next_cursor)
 
 
 @app.route('/artists/search', methods=['POST'])
@@ -265,37 +397,27 @@ def search_artists():
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
     search_term = request.form.get('search_term', '')
-    filtered_artists = Artist.query.filter(Artist.name.ilike(f'%{search_term.lower()}%'))
+    count, artists = artist_search.search(search_term, limit=SEARCH_LIMIT)
     response = {
-        "count": filtered_artists.count(),
-        "data": [{
-            "id": artist.id,
-            "name": artist.name,
-        } for artist in filtered_artists]
+        "count": count,
+        "data": artists
     }
     return render_template('pages/search_artists.html', results=response,
                            search_term=search_term)
 
 
 @app.route('/artists/<int:artist_id>')
+@QueryStats.budget(3)
 def show_artist(artist_id):
     # shows the venue page with the given venue_id
     # TODO: (done) replace with real venue data from the venues table, using venue_id
-    artist = Artist.query.get(artist_id)
+    artist = Artist.query.options(db.joinedload(Artist.genres)).get(artist_id)
     artist_json = artist.json()
-    shows = artist.shows
-    past_shows = []
-    upcoming_shows = []
-    for show in shows:
-        if show.start_time <= datetime.now():
-            past_shows.append(show)
-        else:
-            upcoming_shows.append(show)
+    past_shows, upcoming_shows = past_and_upcoming_shows(Show.artist_id, artist_id, Show.venue)
     artist_json['past_shows_count'] = len(past_shows)
     artist_json['upcoming_shows_count'] = len(upcoming_shows)
     artist_json['past_shows'] = [show.json_venue() for show in past_shows]
     artist_json['upcoming_shows'] = [show.json_venue() for show in upcoming_shows]
-    artist_json['genres'] = artist.genres.split(',')
 
     return render_template('pages/show_artist.html', artist=artist_json)
 
@@ -347,9 +469,9 @@ def create_artist_submission():
     # TODO: (done) modify data to be the data object returned from db insertion
 
     try:
-        artist = Artist(**request.form)
+        artist = Artist(**{key: value for key, value in request.form.items() if key != 'genres'})
         artist.seeking_venue = bool(request.form.get('seeking_venue', None))
-        artist.genres = ''.join(request.form.getlist('genres'))
+        artist.genres = Genre.named(request.form.getlist('genres'))
         db.session.add(artist)
         db.session.commit()
         # on successful db insert, flash success
@@ -365,13 +487,21 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@QueryStats.budget(1)
 def shows():
     # displays list of shows at /shows
     # TODO: (done) replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
-    shows = Show.query.all()
+    try:
+        shows, next_cursor = keyset_page(
+            Show.query.options(db.joinedload(Show.venue), db.joinedload(Show.artist)),
+            (Show.start_time, Show.artist_id, Show.venue_id),
+            request.args.get('cursor'),
+            request.args.get('limit', PAGE_SIZE, type=int))
+    except ValueError:
+        abort(400)
     data = [show.json() for show in shows]
-    return render_template('pages/shows.html', shows=data)
+    return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
 
 
 @app.route('/shows/create')
@@ -403,6 +533,20 @@ def create_show_submission():
     return redirect(url_for('index'))
 
 
+#  Commands
+#  ----------------------------------------------------------------
+
+@app.cli.command('import-data')
+@click.option('--venues', type=click.Path(exists=True, dir_okay=False), help='Venues .csv or .jsonl file.')
+@click.option('--artists', type=click.Path(exists=True, dir_okay=False), help='Artists .csv or .jsonl file.')
+@click.option('--shows', type=click.Path(exists=True, dir_okay=False), help='Shows .csv or .jsonl file.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows written per transaction.')
+def import_data(venues, artists, shows, batch_size):
+    """Bulk-loads venues, artists and shows (see importer.py for the file format)."""
+    from importer import Importer
+    Importer(batch_size=batch_size).run(venues=venues, artists=artists, shows=shows)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
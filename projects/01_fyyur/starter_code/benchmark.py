@@ -0,0 +1,334 @@
+"""Benchmarks for Fyyur's data access paths.
+
+Everything runs against a throwaway in-memory SQLite database, so nothing here
+touches the Postgres instance from config.py:
+
+    $ python benchmark.py venues --sizes 100 10000 100000
+    $ python benchmark.py show-pages --sizes 10 1000 5000
+    $ python benchmark.py listings --sizes 1000 100000 1000000
+    $ python benchmark.py search --sizes 10000 1000000
+    $ python benchmark.py datetime-filter --sizes 10000
+    $ python benchmark.py routes --sizes 100 1000 --requests 50
+"""
+import argparse
+import html
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import dateutil.parser
+from babel import dates
+
+from app import app, db, Venue, Artist, Show, Genre, artist_genre
+from formatting import format_datetime
+from query_stats import recording
+from synthetic import CITIES, GENRES, Dataset, made_up_name, write_dataset
+
+
+def reset_database():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+
+def seed_venues(num_venues, num_areas=50, shows_per_venue=2):
+    """Inserts venues spread over ``num_areas`` cities, half their shows in the future."""
+    now = datetime.now()
+    db.session.execute(Artist.__table__.insert(), [{'id': 1, 'name': 'Benchmark Band'}])
+    db.session.execute(Venue.__table__.insert(), [{
+        'id': i,
+        'name': f'Venue {i}',
+        'city': f'City {i % num_areas}',
+        'state': 'CA',
+    } for i in range(1, num_venues + 1)])
+    offsets = [timedelta(days=day) for day in range(-shows_per_venue // 2, shows_per_venue // 2 + 1) if day]
+    db.session.execute(Show.__table__.insert(), [{
+        'artist_id': 1,
+        'venue_id': i,
+        'start_time': now + offset,
+    } for i in range(1, num_venues + 1) for offset in offsets[:shows_per_venue]])
+    db.session.commit()
+
+
+def seed_show_pages(num_shows):
+    """Gives venue 1 and artist 1 ``num_shows`` shows each, every one with a different counterpart."""
+    now = datetime.now()
+    ids = range(1, num_shows + 1)
+    db.session.execute(Venue.__table__.insert(), [{'id': i, 'name': f'Venue {i}'} for i in ids])
+    db.session.execute(Artist.__table__.insert(), [{'id': i, 'name': f'Artist {i}'} for i in ids])
+    db.session.execute(Show.__table__.insert(), [{
+        'artist_id': i,
+        'venue_id': 1,
+        'start_time': now + timedelta(hours=i if i % 2 else -i),
+    } for i in ids] + [{
+        'artist_id': 1,
+        'venue_id': i,
+        'start_time': now + timedelta(hours=i if i % 2 else -i, minutes=1),
+    } for i in ids])
+    db.session.commit()
+
+
+def seed_listings(num_shows, num_artists=1000, num_venues=100):
+    now = datetime.now()
+    db.session.execute(Venue.__table__.insert(), [{'id': i, 'name': f'Venue {i}'} for i in range(1, num_venues + 1)])
+    db.session.execute(Artist.__table__.insert(), [{'id': i, 'name': f'Artist {i}'} for i in range(1, num_artists + 1)])
+    db.session.execute(Show.__table__.insert(), [{
+        'artist_id': i % num_artists + 1,
+        'venue_id': i % num_venues + 1,
+        'start_time': now + timedelta(minutes=i),
+    } for i in range(num_shows)])
+    db.session.commit()
+
+
+def seed_names(num_names, seed=0):
+    """Artists named from a small vocabulary plus a made-up surname, so terms range from common to rare."""
+    rng = random.Random(seed)
+    rows = []
+    links = []
+    for i in range(1, num_names + 1):
+        city, state = rng.choice(CITIES)
+        rows.append({
+            'id': i,
+            'name': made_up_name(rng),
+            'city': city,
+            'state': state,
+        })
+        links.extend({'artist_id': i, 'genre_id': genre_id} for genre_id in rng.sample(range(1, len(GENRES) + 1), 2))
+    db.session.execute(Genre.__table__.insert(), [{'id': i, 'name': name} for i, name in enumerate(GENRES, 1)])
+    db.session.execute(Artist.__table__.insert(), rows)
+    db.session.execute(artist_genre.insert(), links)
+    db.session.commit()
+
+
+def bench_venues(sizes):
+    print(f'{"venues":>10} {"queries":>8} {"ms":>10}')
+    client = app.test_client()
+    for size in sizes:
+        reset_database()
+        seed_venues(size)
+        with recording() as counter:
+            start = time.perf_counter()
+            response = client.get('/venues')
+            elapsed = time.perf_counter() - start
+        assert response.status_code == 200, response.status_code
+        print(f'{size:>10} {counter.count:>8} {elapsed * 1000:>10.1f}')
+
+
+def bench_show_pages(sizes):
+    print(f'{"shows":>10} {"page":>12} {"queries":>8} {"ms":>10}')
+    client = app.test_client()
+    for size in sizes:
+        reset_database()
+        seed_show_pages(size)
+        for page in ('/venues/1', '/artists/1'):
+            db.session.remove()
+            with recording() as counter:
+                start = time.perf_counter()
+                response = client.get(page)
+                elapsed = time.perf_counter() - start
+            assert response.status_code == 200, response.status_code
+            print(f'{size:>10} {page:>12} {counter.count:>8} {elapsed * 1000:>10.1f}')
+
+
+def bench_listings(sizes, pages=5):
+    """Latency of the first page and of the page reached after following ``pages`` cursors."""
+    print(f'{"shows":>10} {"listing":>10} {"page":>6} {"queries":>8} {"ms":>10}')
+    client = app.test_client()
+    for size in sizes:
+        reset_database()
+        seed_listings(size)
+        for listing in ('shows', 'artists'):
+            url = f'/{listing}'
+            for page in range(pages + 1):
+                with recording() as counter:
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    elapsed = time.perf_counter() - start
+                assert response.status_code == 200, response.status_code
+                url = next_page_link(response)
+                if page in (0, pages):
+                    print(f'{size:>10} {listing:>10} {page + 1:>6} {counter.count:>8} {elapsed * 1000:>10.1f}')
+
+
+def bench_search(sizes, terms=('kavedomi', 'lounge', 'sax band', 'jazz san francisco', 'qu', 'nothing like it'), repeat=20):
+    from app import artist_search, SEARCH_LIMIT
+    print(f'{"names":>10} {"term":>20} {"matches":>8} {"median ms":>10} {"max ms":>10}')
+    for size in sizes:
+        reset_database()
+        seed_names(size)
+        artist_search.invalidate()
+        start = time.perf_counter()
+        artist_search.search('')
+        print(f'{size:>10} {"(index build)":>20} {"":>8} {(time.perf_counter() - start) * 1000:>10.1f}')
+        for term in terms:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                count, _ = artist_search.search(term, limit=SEARCH_LIMIT)
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f'{size:>10} {term:>20} {count:>8} {statistics.median(timings):>10.2f} {max(timings):>10.2f}')
+
+
+def legacy_format_datetime(value, format='medium'):
+    """The filter as it was before formatting.py: reparses the value and the pattern on every call."""
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return dates.format_datetime(date, format, locale='en_US')
+
+
+def bench_datetime_filter(sizes):
+    print(f'{"rows":>10} {"implementation":>24} {"us/row":>10}')
+    now = datetime.now()
+    for size in sizes:
+        values = [now + timedelta(minutes=i) for i in range(size)]
+        strings = [value.isoformat() for value in values]
+        cases = [
+            ('legacy, iso strings', legacy_format_datetime, strings),
+            ('cached, iso strings', format_datetime, strings),
+            ('cached, datetimes', format_datetime, values),
+        ]
+        for label, format, inputs in cases:
+            start = time.perf_counter()
+            for value in inputs:
+                format(value, 'full')
+            elapsed = time.perf_counter() - start
+            print(f'{size:>10} {label:>24} {elapsed / size * 1e6:>10.1f}')
+
+
+def route_scenarios(dataset):
+    """``(rule, method, request)`` for every route, ``request(i)`` giving the url and client kwargs of run ``i``."""
+    venue = lambda i: i % dataset.venues + 1
+    artist = lambda i: i % dataset.artists + 1
+    terms = ['jazz', 'san francisco', 'lounge band', 'qu', 'nothing like it']
+    owner_form = lambda kind, i: {
+        'name': f'Load Test {kind} {i}',
+        'city': 'San Francisco',
+        'state': 'CA',
+        'phone': '415-000-0000',
+        'genres': ['Jazz', 'Folk'],
+        'facebook_link': 'https://www.facebook.com/loadtest',
+    }
+    return [
+        ('/', 'GET', lambda i: ('/', {})),
+        ('/venues', 'GET', lambda i: ('/venues', {})),
+        ('/venues/search', 'POST', lambda i: ('/venues/search', {'data': {'search_term': terms[i % len(terms)]}})),
+        ('/venues/<int:venue_id>', 'GET', lambda i: (f'/venues/{venue(i)}', {})),
+        ('/venues/create', 'GET', lambda i: ('/venues/create', {})),
+        ('/venues/create', 'POST', lambda i: ('/venues/create', {'data': dict(owner_form('Venue', i), address='1 Main Street')})),
+        # each run deletes a different venue, counting down from the last one
+        ('/venues/<venue_id>', 'DELETE', lambda i: (f'/venues/{dataset.venues - i}', {})),
+        ('/venues/<int:venue_id>/edit', 'GET', lambda i: (f'/venues/{venue(i)}/edit', {})),
+        ('/venues/<int:venue_id>/edit', 'POST', lambda i: (f'/venues/{venue(i)}/edit', {'data': owner_form('Venue', i)})),
+        ('/artists', 'GET', lambda i: ('/artists', {})),
+        ('/artists/search', 'POST', lambda i: ('/artists/search', {'data': {'search_term': terms[i % len(terms)]}})),
+        ('/artists/<int:artist_id>', 'GET', lambda i: (f'/artists/{artist(i)}', {})),
+        ('/artists/<int:artist_id>/edit', 'GET', lambda i: (f'/artists/{artist(i)}/edit', {})),
+        ('/artists/<int:artist_id>/edit', 'POST', lambda i: (f'/artists/{artist(i)}/edit', {'data': owner_form('Artist', i)})),
+        ('/artists/create', 'GET', lambda i: ('/artists/create', {})),
+        ('/artists/create', 'POST', lambda i: ('/artists/create', {'data': owner_form('Artist', i)})),
+        ('/shows', 'GET', lambda i: ('/shows', {})),
+        ('/shows/create', 'GET', lambda i: ('/shows/create', {})),
+        ('/shows/create', 'POST', lambda i: ('/shows/create', {'data': {
+            'artist_id': artist(i),
+            'venue_id': venue(i),
+            'start_time': (dataset.anchor + timedelta(days=400, minutes=i)).strftime('%Y-%m-%d %H:%M:%S'),
+        }})),
+    ]
+
+
+def uncovered_routes(scenarios):
+    covered = {(rule, method) for rule, method, _ in scenarios}
+    return sorted((rule.rule, method) for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+                  for method in rule.methods - {'HEAD', 'OPTIONS'} if (rule.rule, method) not in covered)
+
+
+def request_status(client, url, method, kwargs):
+    """The response status, or ``'error'`` when the view raised, which the test client propagates."""
+    try:
+        return client.open(url, method=method, **kwargs).status_code
+    except Exception:
+        db.session.rollback()
+        return 'error'
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def bench_routes(sizes, requests=20):
+    """Latency percentiles, queries and peak Python memory per request for every route.
+
+    ``size`` is the number of venues; the dataset has twice as many artists and
+    ten shows per venue, generated by synthetic.py and loaded by the importer.
+    """
+    from importer import Importer
+    client = app.test_client()
+    print(f'{"venues":>8} {"route":>36} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"peak KiB":>9} {"status":>7}')
+    for size in sizes:
+        dataset = Dataset(venues=size, artists=size * 2, shows=size * 10)
+        reset_database()
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_dataset(directory, dataset)
+            Importer(echo=lambda *args: None).run(**paths)
+        scenarios = route_scenarios(dataset)
+        for rule, method in uncovered_routes(scenarios):
+            print(f'warning: no scenario for {method} {rule}')
+        for rule, method, make_request in scenarios:
+            timings = []
+            queries = []
+            statuses = set()
+            for i in range(requests):
+                url, kwargs = make_request(i)
+                db.session.remove()
+                with recording() as counter:
+                    start = time.perf_counter()
+                    statuses.add(request_status(client, url, method, kwargs))
+                    timings.append((time.perf_counter() - start) * 1000)
+                queries.append(counter.count)
+            # traced separately, tracemalloc slows every allocation down
+            url, kwargs = make_request(requests)
+            db.session.remove()
+            tracemalloc.start()
+            request_status(client, url, method, kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f'{size:>8} {method + " " + rule:>36} {percentile(timings, 0.5):>8.1f} {percentile(timings, 0.95):>8.1f} '
+                  f'{percentile(timings, 0.99):>8.1f} {statistics.median(queries):>8g} {peak / 1024:>9.0f} '
+                  f'{",".join(map(str, sorted(statuses))):>7}')
+
+
+def next_page_link(response):
+    match = re.search(r'<a href="([^"]+)"><button class="btn btn-default">Next page', response.get_data(as_text=True))
+    return html.unescape(match.group(1))
+
+
+BENCHMARKS = {
+    'venues': bench_venues,
+    'show-pages': bench_show_pages,
+    'listings': bench_listings,
+    'search': bench_search,
+    'datetime-filter': bench_datetime_filter,
+    'routes': bench_routes,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 100000])
+    parser.add_argument('--requests', type=int, default=20, help='Requests per route, for the routes benchmark.')
+    args = parser.parse_args()
+    options = {'requests': args.requests} if args.benchmark == 'routes' else {}
+    with app.app_context():
+        BENCHMARKS[args.benchmark](args.sizes, **options)
@@ -8,5 +8,5 @@ DEBUG = True
 
 # Connect to the database
 
-SQLALCHEMY_DATABASE_URI = 'postgresql://ducdoan@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://ducdoan@localhost:5432/fyyur')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -0,0 +1,35 @@
+"""Date formatting for the ``datetime`` template filter.
+
+Babel patterns and locales are parsed once and reused, so formatting a row only
+costs applying the compiled pattern.
+"""
+from datetime import datetime
+from functools import lru_cache
+
+import dateutil.parser
+from babel import Locale, dates
+
+DEFAULT_LOCALE = 'en_US'
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=None)
+def get_locale(locale):
+    return Locale.parse(locale)
+
+
+@lru_cache(maxsize=256)
+def get_pattern(format):
+    """The compiled Babel pattern for a named format or a raw CLDR pattern."""
+    return dates.parse_pattern(FORMATS.get(format, format))
+
+
+def format_datetime(value, format='medium', locale=None):
+    """Formats a ``datetime``, or a string ``dateutil`` can parse, in ``locale``."""
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    return get_pattern(format).apply(value, get_locale(locale or DEFAULT_LOCALE))
@@ -0,0 +1,240 @@
+"""Bulk loading of venues, artists and shows from CSV or JSON Lines files.
+
+Used by the ``flask import-data`` command:
+
+    $ export FLASK_APP=app.py
+    $ flask import-data --venues fixtures/venues.jsonl --artists fixtures/artists.jsonl \
+        --shows fixtures/shows.jsonl --batch-size 5000
+
+Files are streamed and written in batches, one transaction per batch, through
+``COPY`` on Postgres and multi-row inserts elsewhere.
+
+Venues and artists may carry a ``ref``, an identifier from the source data that
+shows point at through ``venue_ref`` / ``artist_ref``. Refs are resolved in
+memory, so shows must be imported in the same run as the rows they reference,
+unless they use database ids (``venue_id`` / ``artist_id``) directly.
+
+Ids are allocated by the importer, so nothing else should be writing venues or
+artists while it runs. Running servers only see imported rows in search once
+restarted, as the search indexes are kept in memory.
+"""
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from itertools import islice
+
+import click
+import dateutil.parser
+from sqlalchemy import exc, func
+
+from app import db, Venue, Artist, Show, Genre, venue_genre, artist_genre, venue_search, artist_search
+
+DEFAULT_BATCH_SIZE = 1000
+TRUE_STRINGS = {'1', 't', 'true', 'y', 'yes', 'on'}
+
+
+def read_records(path):
+    """Yields ``(line number, record)`` for every record of a .csv or .jsonl file."""
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_num, json.loads(line)
+            except ValueError as e:
+                raise click.ClickException(f'{path}:{line_num}: {e}')
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def convert(column, value):
+    """Coerces a value read from a file, where everything may be a string, to the column's type."""
+    if value is None or value == '':
+        return None
+    if isinstance(column.type, db.Boolean) and isinstance(value, str):
+        return value.strip().lower() in TRUE_STRINGS
+    if isinstance(column.type, db.Integer):
+        return int(value)
+    if isinstance(column.type, db.DateTime):
+        if not isinstance(value, datetime):
+            value = parse_datetime(value)
+        # start times are stored as wall-clock times, as Postgres does for timestamp without time zone
+        return value.replace(tzinfo=None)
+    return value
+
+
+def parse_datetime(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.parse(value)
+
+
+class Progress:
+    """Reports rows written and throughput, at most once per ``interval`` seconds."""
+
+    def __init__(self, label, echo=click.echo, interval=1.0):
+        self.label = label
+        self.echo = echo
+        self.interval = interval
+        self.count = self.reported_count = 0
+        self.started = self.reported = time.perf_counter()
+
+    def update(self, count):
+        self.count += count
+        if time.perf_counter() - self.reported >= self.interval:
+            self.report()
+
+    def done(self):
+        if self.count != self.reported_count or not self.count:
+            self.report()
+
+    def report(self):
+        self.reported = time.perf_counter()
+        self.reported_count = self.count
+        elapsed = self.reported - self.started
+        self.echo(f'{self.label}: {self.count} rows in {elapsed:.1f}s ({self.count / max(elapsed, 1e-9):.0f} rows/s)')
+
+
+class Importer:
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, echo=click.echo):
+        self.batch_size = batch_size
+        self.echo = echo
+        self.refs = {Venue: {}, Artist: {}}
+        self.genre_ids = {}
+
+    def run(self, venues=None, artists=None, shows=None):
+        self.genre_ids = dict(db.session.query(Genre.name, Genre.id))
+        try:
+            if venues:
+                self.import_owners(venues, Venue, venue_genre, 'venue_id')
+            if artists:
+                self.import_owners(artists, Artist, artist_genre, 'artist_id')
+            if shows:
+                self.import_shows(shows)
+        finally:
+            venue_search.invalidate()
+            artist_search.invalidate()
+
+    def import_owners(self, path, model, link_table, link_column):
+        """Imports venues or artists, with their genres."""
+        columns = [column for column in model.__table__.columns if column.name != 'id']
+        next_id = (db.session.query(func.max(model.id)).scalar() or 0) + 1
+        progress = Progress(model.__tablename__, self.echo)
+        for batch in batches(read_records(path), self.batch_size):
+            rows = []
+            links = []
+            for line_num, record in batch:
+                try:
+                    row = {column.name: convert(column, record.get(column.name)) for column in columns}
+                except ValueError as e:
+                    raise click.ClickException(f'{path}:{line_num}: {e}')
+                row['id'] = next_id
+                next_id += 1
+                if record.get('ref') not in (None, ''):
+                    self.refs[model][str(record['ref'])] = row['id']
+                links.extend({link_column: row['id'], 'genre_id': genre_id}
+                             for genre_id in self.genre_ids_for(record.get('genres')))
+                rows.append(row)
+            self.commit_batch(path, line_num, (model.__table__, rows), (link_table, links))
+            progress.update(len(rows))
+        self.reset_id_sequence(model)
+        progress.done()
+
+    def import_shows(self, path):
+        progress = Progress(Show.__tablename__, self.echo)
+        start_time = Show.__table__.c.start_time
+        for batch in batches(read_records(path), self.batch_size):
+            rows = []
+            for line_num, record in batch:
+                try:
+                    rows.append({
+                        'venue_id': self.resolve(Venue, record, 'venue'),
+                        'artist_id': self.resolve(Artist, record, 'artist'),
+                        'start_time': convert(start_time, record.get('start_time')),
+                    })
+                except ValueError as e:
+                    raise click.ClickException(f'{path}:{line_num}: {e}')
+            self.commit_batch(path, line_num, (Show.__table__, rows))
+            progress.update(len(rows))
+        progress.done()
+
+    def resolve(self, model, record, prefix):
+        """The database id a show record points at, through ``<prefix>_ref`` or ``<prefix>_id``."""
+        ref = record.get(f'{prefix}_ref')
+        if ref not in (None, ''):
+            try:
+                return self.refs[model][str(ref)]
+            except KeyError:
+                raise ValueError(f'unknown {prefix}_ref {ref!r}') from None
+        if record.get(f'{prefix}_id') in (None, ''):
+            raise ValueError(f'missing {prefix}_ref or {prefix}_id')
+        return int(record[f'{prefix}_id'])
+
+    def genre_ids_for(self, genres):
+        """Ids of the genres of a record, given as a list or a comma-joined string."""
+        if isinstance(genres, str):
+            genres = genres.split(',')
+        names = dict.fromkeys(name.strip() for name in genres or [] if name.strip())
+        missing = [name for name in names if name not in self.genre_ids]
+        if missing:
+            genres = [Genre(name=name) for name in missing]
+            db.session.add_all(genres)
+            db.session.flush()
+            self.genre_ids.update((genre.name, genre.id) for genre in genres)
+        return [self.genre_ids[name] for name in names]
+
+    def commit_batch(self, path, line_num, *writes):
+        """Writes ``(table, rows)`` pairs in one transaction; earlier batches stay committed on failure."""
+        try:
+            for table, rows in writes:
+                self.write(table, rows)
+            db.session.commit()
+        except exc.DBAPIError as e:
+            db.session.rollback()
+            raise click.ClickException(f'{path}: batch ending at line {line_num} was rejected: {e.orig}')
+
+    def write(self, table, rows):
+        if not rows:
+            return
+        if db.engine.dialect.name == 'postgresql':
+            self.copy(table, rows)
+        else:
+            db.session.execute(table.insert(), rows)
+
+    def copy(self, table, rows):
+        """Streams rows into Postgres with COPY, far cheaper than INSERTs at this volume."""
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[column] for column in columns])
+        buffer.seek(0)
+        preparer = db.engine.dialect.identifier_preparer
+        column_list = ', '.join(preparer.quote(column) for column in columns)
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert(f'COPY {preparer.format_table(table)} ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+    def reset_id_sequence(self, model):
+        """Moves the Postgres id sequence past the ids the importer allocated."""
+        if db.engine.dialect.name != 'postgresql':
+            return
+        table = db.engine.dialect.identifier_preparer.format_table(model.__table__)
+        db.session.execute(
+            f"SELECT setval(pg_get_serial_sequence(:table, 'id'), (SELECT max(id) FROM {table}))",
+            {'table': table})
+        db.session.commit()
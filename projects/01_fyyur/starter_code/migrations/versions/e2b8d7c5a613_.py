@@ -0,0 +1,60 @@
+"""move comma-joined genres into the genre association tables
+
+Revision ID: e2b8d7c5a613
+Revises: a4e61f3b9d08
+Create Date: 2026-10-18 13:58:09.731240
+
+Existing values are split on commas. Artists created through the old form had
+their genres joined without a separator and come through as a single genre.
+"""
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b8d7c5a613'
+down_revision = 'a4e61f3b9d08'
+branch_labels = None
+depends_on = None
+
+genre = sa.table('genre', sa.column('id', sa.Integer), sa.column('name', sa.String))
+
+# owner table -> (association table, owner id column)
+OWNERS = {
+    'Venue': ('venue_genre', 'venue_id'),
+    'Artist': ('artist_genre', 'artist_id'),
+}
+
+
+def upgrade():
+    bind = op.get_bind()
+    genre_ids = dict(bind.execute(sa.select([genre.c.name, genre.c.id])).fetchall())
+    for owner_name, (link_name, owner_column) in OWNERS.items():
+        owner = sa.table(owner_name, sa.column('id', sa.Integer), sa.column('genres', sa.String))
+        link = sa.table(link_name, sa.column(owner_column, sa.Integer), sa.column('genre_id', sa.Integer))
+        links = []
+        for owner_id, genres in bind.execute(sa.select([owner.c.id, owner.c.genres]).where(owner.c.genres.isnot(None))):
+            names = dict.fromkeys(name.strip() for name in genres.split(',') if name.strip())
+            for name in names:
+                if name not in genre_ids:
+                    genre_ids[name] = bind.execute(genre.insert().values(name=name).returning(genre.c.id)).scalar()
+                links.append({owner_column: owner_id, 'genre_id': genre_ids[name]})
+        if links:
+            op.bulk_insert(link, links)
+        op.drop_column(owner_name, 'genres')
+
+
+def downgrade():
+    bind = op.get_bind()
+    genre_names = dict(bind.execute(sa.select([genre.c.id, genre.c.name])).fetchall())
+    for owner_name, (link_name, owner_column) in OWNERS.items():
+        op.add_column(owner_name, sa.Column('genres', sa.String(length=120), nullable=True))
+        owner = sa.table(owner_name, sa.column('id', sa.Integer), sa.column('genres', sa.String))
+        link = sa.table(link_name, sa.column(owner_column, sa.Integer), sa.column('genre_id', sa.Integer))
+        genres = defaultdict(list)
+        for owner_id, genre_id in bind.execute(sa.select([link.c[owner_column], link.c.genre_id])):
+            genres[owner_id].append(genre_names[genre_id])
+        for owner_id, names in genres.items():
+            bind.execute(owner.update().where(owner.c.id == owner_id).values(genres=','.join(sorted(names))))
@@ -0,0 +1,83 @@
+"""full-text search vectors for ranked venue and artist search
+
+Revision ID: f1c3a7d9e245
+Revises: e2b8d7c5a613
+Create Date: 2026-10-19 09:12:44.518203
+
+Each venue and artist gets a ``search_vector`` over its name (weight A), city
+and genres (B) and state (C), with a GIN index. Triggers keep it current when
+the row or its genre links change. The 'simple' configuration is used so
+that no word is dropped as a stop word.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c3a7d9e245'
+down_revision = 'e2b8d7c5a613'
+branch_labels = None
+depends_on = None
+
+# owner table -> (association table, owner id column, name prefix of the functions, triggers and index)
+OWNERS = {
+    'Venue': ('venue_genre', 'venue_id', 'venue'),
+    'Artist': ('artist_genre', 'artist_id', 'artist'),
+}
+
+
+def upgrade():
+    for owner, (link, owner_column, prefix) in OWNERS.items():
+        op.add_column(owner, sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+        op.execute(f"""
+            CREATE FUNCTION {prefix}_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector :=
+                    setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+                    setweight(to_tsvector('simple', coalesce(NEW.city, '')), 'B') ||
+                    setweight(to_tsvector('simple', coalesce((
+                        SELECT string_agg(genre.name, ' ')
+                        FROM {link} JOIN genre ON genre.id = {link}.genre_id
+                        WHERE {link}.{owner_column} = NEW.id), '')), 'B') ||
+                    setweight(to_tsvector('simple', coalesce(NEW.state, '')), 'C');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        # search_vector is listed so that the genre trigger can force a recomputation
+        op.execute(f"""
+            CREATE TRIGGER {prefix}_search_vector_update
+            BEFORE INSERT OR UPDATE OF name, city, state, search_vector ON "{owner}"
+            FOR EACH ROW EXECUTE PROCEDURE {prefix}_search_vector_update()
+        """)
+        op.execute(f"""
+            CREATE FUNCTION {prefix}_genre_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    UPDATE "{owner}" SET search_vector = NULL WHERE id = OLD.{owner_column};
+                ELSE
+                    UPDATE "{owner}" SET search_vector = NULL WHERE id = NEW.{owner_column};
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {prefix}_genre_search_vector_update
+            AFTER INSERT OR DELETE ON {link}
+            FOR EACH ROW EXECUTE PROCEDURE {prefix}_genre_search_vector_update()
+        """)
+        op.execute(f'UPDATE "{owner}" SET search_vector = NULL')
+        op.create_index(f'ix_{prefix}_search_vector', owner, ['search_vector'], unique=False,
+                        postgresql_using='gin')
+
+
+def downgrade():
+    for owner, (link, owner_column, prefix) in OWNERS.items():
+        op.drop_index(f'ix_{prefix}_search_vector', table_name=owner)
+        op.execute(f'DROP TRIGGER {prefix}_genre_search_vector_update ON {link}')
+        op.execute(f'DROP FUNCTION {prefix}_genre_search_vector_update()')
+        op.execute(f'DROP TRIGGER {prefix}_search_vector_update ON "{owner}"')
+        op.execute(f'DROP FUNCTION {prefix}_search_vector_update()')
+        op.drop_column(owner, 'search_vector')
@@ -0,0 +1,194 @@
+"""Per-request SQL statistics: query count, database time and the slowest statements.
+
+    stats = QueryStats(app)
+
+Every response then carries a ``Server-Timing`` header, which browsers show in
+their network panel::
+
+    Server-Timing: db;dur=12.4;desc="3 queries"
+
+and a JSON record is logged on the ``query_stats`` logger for each request.
+Statements slower than ``QUERY_STATS_SLOW_MS`` are logged as warnings.
+
+Query budgets catch N+1 queries. A view decorated with ``@QueryStats.budget(3)``,
+or any view when ``QUERY_STATS_BUDGET`` is set, logs a warning when a request
+runs more statements than that. Under ``app.testing`` it raises
+``QueryBudgetExceeded`` instead, failing the test. Tests can also bound any
+block of code:
+
+    with query_budget(3):
+        client.get('/venues/1')
+
+Statements are counted through SQLAlchemy engine events on the thread that runs
+them, so every engine of the process is covered.
+
+The trivia and coffee shop backends carry copies of this module, which
+check_shared_modules.py at the repository root keeps in step with it.
+"""
+import heapq
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('query_stats')
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryRecorder:
+    """Statements run while the recorder is active, keeping the ``keep_slowest`` slowest."""
+
+    def __init__(self, keep_slowest=3):
+        self.keep_slowest = keep_slowest
+        self.count = 0
+        self.duration = 0.0
+        self._slowest = []
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        entry = (duration, self.count, statement)
+        if len(self._slowest) < self.keep_slowest:
+            heapq.heappush(self._slowest, entry)
+        elif self._slowest and entry > self._slowest[0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        """``[(seconds, statement), ...]``, slowest first."""
+        return [(duration, statement) for duration, _, statement in sorted(self._slowest, reverse=True)]
+
+
+def _active_recorders():
+    if not hasattr(_local, 'recorders'):
+        _local.recorders = []
+    return _local.recorders
+
+
+@contextmanager
+def recording(keep_slowest=3):
+    """Records the statements run by the current thread while the block runs."""
+    recorder = QueryRecorder(keep_slowest)
+    recorders = _active_recorders()
+    recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        recorders.remove(recorder)
+
+
+@contextmanager
+def query_budget(max_queries):
+    """Raises ``QueryBudgetExceeded`` if the block runs more than ``max_queries`` statements."""
+    with recording() as recorder:
+        yield recorder
+    if recorder.count > max_queries:
+        raise QueryBudgetExceeded(over_budget_message(recorder, max_queries))
+
+
+def over_budget_message(recorder, max_queries, where='block'):
+    statements = '\n'.join(f'  {duration * 1000:.1f}ms {statement}' for duration, statement in recorder.slowest)
+    return f'{where} ran {recorder.count} queries, over its budget of {max_queries}. Slowest:\n{statements}'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_recorders():
+        conn.info['query_stats_start'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop('query_stats_start', None)
+    if start is None:
+        return
+    duration = time.perf_counter() - start
+    for recorder in _active_recorders():
+        recorder.record(statement, duration)
+
+
+class QueryStats:
+    """Flask extension reporting the queries of every request.
+
+    Settings, read from ``app.config``:
+
+    - ``QUERY_STATS_SLOW_MS``: statements at least this slow are logged as warnings (default 100).
+    - ``QUERY_STATS_BUDGET``: query budget of views without their own (default none).
+    - ``QUERY_STATS_RAISE``: raise ``QueryBudgetExceeded`` on requests over budget (default ``app.testing``).
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_STATS_SLOW_MS', 100)
+        app.config.setdefault('QUERY_STATS_BUDGET', None)
+        app.config.setdefault('QUERY_STATS_RAISE', None)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+
+    @staticmethod
+    def budget(max_queries):
+        """Decorator setting the query budget of a view; goes below ``@app.route``."""
+        def decorator(view):
+            view.query_budget = max_queries
+            return view
+        return decorator
+
+    def _start(self):
+        g.query_stats = QueryRecorder()
+        _active_recorders().append(g.query_stats)
+
+    def _finish(self, response):
+        recorder = self._stop()
+        if recorder is None:
+            return response
+        config = current_app.config
+        response.headers.add('Server-Timing', f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries"')
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 1),
+            'slowest': [{'ms': round(duration * 1000, 1), 'statement': statement}
+                        for duration, statement in recorder.slowest],
+        }))
+        for duration, statement in recorder.slowest:
+            if duration * 1000 >= config['QUERY_STATS_SLOW_MS']:
+                logger.warning('slow query on %s %s (%.1fms): %s', request.method, request.path, duration * 1000, statement)
+        view = current_app.view_functions.get(request.endpoint)
+        max_queries = getattr(view, 'query_budget', config['QUERY_STATS_BUDGET'])
+        if max_queries is not None and recorder.count > max_queries:
+            message = over_budget_message(recorder, max_queries, f'{request.method} {request.path}')
+            should_raise = config['QUERY_STATS_RAISE']
+            if should_raise is None:
+                should_raise = current_app.testing
+            if should_raise:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def _teardown(self, exc):
+        # requests that failed before after_request still have to stop recording
+        self._stop()
+
+    @staticmethod
+    def _stop():
+        recorder = g.pop('query_stats', None)
+        if recorder is not None:
+            _active_recorders().remove(recorder)
+        return recorder
@@ -0,0 +1,355 @@
+"""Search over venues and artists.
+
+On Postgres, name search is a plain ``ILIKE '%term%'`` served by the pg_trgm GIN
+indexes (see migration 5d0b9e4a7c21), and ranked search ("jazz san francisco")
+is ranked in SQL with ``ts_rank`` over the ``search_vector`` column and GIN
+index of migration f1c3a7d9e245, which triggers keep current. The column is
+deliberately not mapped on the models, so the ORM never reads or writes it.
+
+Other databases, e.g. the SQLite database used by benchmark.py, get in-memory
+indexes instead: a trigram index for names, and an inverted index over the
+name, city, state and genres of every row for ranked search. They are built
+lazily from the table on first use and then follow committed ORM inserts,
+updates and deletes. Anything that writes around the ORM (bulk inserts,
+``Query.delete()``) must call ``invalidate()`` afterwards.
+"""
+import bisect
+import heapq
+import re
+import threading
+from collections import defaultdict
+
+from sqlalchemy import event, func, text
+from sqlalchemy.orm import Session, object_session
+
+PENDING_CHANGES = 'search_index_changes'
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def escape_like(term, escape='\\'):
+    return term.replace(escape, escape * 2).replace('%', escape + '%').replace('_', escape + '_')
+
+
+class ModelIndex:
+    """In-memory index over the rows of one model.
+
+    Subclasses list the ``columns`` the index is built from and implement
+    ``document(values)``, which turns a row's column values into whatever
+    ``add(doc_id, document)`` stores, as well as ``remove(doc_id)`` and ``clear()``.
+    """
+    columns = ()
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+        self.lock = threading.RLock()
+        self._built = False
+        event.listen(model, 'after_insert', self._queue_add)
+        event.listen(model, 'after_update', self._queue_add)
+        event.listen(model, 'after_delete', self._queue_remove)
+
+    def document(self, values):
+        raise NotImplementedError
+
+    def add(self, doc_id, document):
+        raise NotImplementedError
+
+    def remove(self, doc_id):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def rows(self):
+        """``(id, values)`` for every row of the table, ``values`` mapping column to value."""
+        query = self.db.session.query(self.model.id, *[getattr(self.model, c) for c in self.columns])
+        for doc_id, *values in query.yield_per(10000):
+            yield doc_id, dict(zip(self.columns, values))
+
+    def values(self, obj):
+        return {column: getattr(obj, column) for column in self.columns}
+
+    def ensure_built(self):
+        with self.lock:
+            if not self._built:
+                self.clear()
+                for doc_id, values in self.rows():
+                    self.add(doc_id, self.document(values))
+                self._built = True
+
+    def invalidate(self):
+        with self.lock:
+            self._built = False
+            self.clear()
+
+    def apply(self, change):
+        with self.lock:
+            if not self._built:
+                return
+            action, doc_id, document = change
+            self.remove(doc_id)
+            if action == 'add':
+                self.add(doc_id, document)
+
+    # Changes are only applied once the session commits, so rolled back rows
+    # never show up in search results.
+    def _queue_add(self, mapper, connection, target):
+        self._queue(target, ('add', target.id, self.document(self.values(target))))
+
+    def _queue_remove(self, mapper, connection, target):
+        self._queue(target, ('remove', target.id, None))
+
+    def _queue(self, target, change):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(PENDING_CHANGES, []).append((self, change))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending_changes(session):
+    for index, change in session.info.pop(PENDING_CHANGES, []):
+        index.apply(change)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_changes(session, previous_transaction):
+    session.info.pop(PENDING_CHANGES, None)
+
+
+class TrigramIndex(ModelIndex):
+    """Case-insensitive substring search on ``name``, the way pg_trgm answers ILIKE."""
+    columns = ('name',)
+
+    def __init__(self, db, model):
+        super().__init__(db, model)
+        self.names = {}
+        self.folded = {}
+        self.postings = defaultdict(set)
+
+    def document(self, values):
+        return values['name'] or ''
+
+    def add(self, doc_id, name):
+        self.names[doc_id] = name
+        self.folded[doc_id] = name.lower()
+        for gram in trigrams(self.folded[doc_id]):
+            self.postings[gram].add(doc_id)
+
+    def remove(self, doc_id):
+        self.names.pop(doc_id, None)
+        folded = self.folded.pop(doc_id, None)
+        if folded is None:
+            return
+        for gram in trigrams(folded):
+            posting = self.postings[gram]
+            posting.discard(doc_id)
+            if not posting:
+                del self.postings[gram]
+
+    def clear(self):
+        self.names = {}
+        self.folded = {}
+        self.postings = defaultdict(set)
+
+    def matches(self, term):
+        """Ids of the names containing ``term``, case-insensitively."""
+        term = term.lower()
+        with self.lock:
+            grams = trigrams(term)
+            if grams:
+                postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+                candidates = postings[0].intersection(*postings[1:])
+            else:
+                candidates = self.folded
+            return [doc_id for doc_id in candidates if term in self.folded[doc_id]]
+
+    def search(self, term, limit=None):
+        with self.lock:
+            ids = self.matches(term)
+            key = lambda doc_id: (self.names[doc_id], doc_id)
+            page = heapq.nsmallest(limit, ids, key=key) if limit is not None else sorted(ids, key=key)
+            return len(ids), [{'id': doc_id, 'name': self.names[doc_id]} for doc_id in page]
+
+
+class NameSearch:
+    """Partial, case-insensitive name search returning the match count and the rows in one pass."""
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+        self.index = TrigramIndex(db, model)
+
+    def search(self, term, limit=None):
+        """Returns ``(count, [{'id': ..., 'name': ...}, ...])`` ordered by name."""
+        if self.db.engine.dialect.name == 'postgresql':
+            return self._search_sql(term, limit)
+        return self._search_index(term, limit)
+
+    def invalidate(self):
+        self.index.invalidate()
+
+    def matching_ids(self, term):
+        """Ids of every row whose name contains ``term``, from the in-memory index."""
+        self.index.ensure_built()
+        return self.index.matches(term)
+
+    def _search_sql(self, term, limit):
+        model = self.model
+        query = self.db.session.query(model.id, model.name, func.count().over()) \
+            .filter(model.name.ilike(f'%{escape_like(term)}%', escape='\\')) \
+            .order_by(model.name, model.id) \
+            .limit(limit)
+        rows = query.all()
+        count = rows[0][2] if rows else 0
+        return count, [{'id': doc_id, 'name': name} for doc_id, name, _ in rows]
+
+    def _search_index(self, term, limit):
+        self.index.ensure_built()
+        return self.index.search(term, limit)
+
+
+class FieldIndex(ModelIndex):
+    """Inverted index from the words of a row's name, city, state and genres to the row.
+
+    Each posting keeps the weight of the most important field the word appears in.
+    """
+    columns = ('name', 'city', 'state')
+    weights = {'name': 4, 'genres': 2, 'city': 2, 'state': 1}
+
+    def __init__(self, db, model):
+        super().__init__(db, model)
+        self.clear()
+
+    def rows(self):
+        genre = self.model.genres.property.mapper.class_
+        genres = defaultdict(list)
+        for doc_id, name in self.db.session.query(self.model.id, genre.name).join(self.model.genres):
+            genres[doc_id].append(name)
+        for doc_id, values in super().rows():
+            values['genres'] = genres.get(doc_id, [])
+            yield doc_id, values
+
+    def values(self, obj):
+        values = super().values(obj)
+        values['genres'] = [genre.name for genre in obj.genres]
+        return values
+
+    def document(self, values):
+        words = {}
+        for field, weight in self.weights.items():
+            text = values[field]
+            for word in tokenize(' '.join(text) if isinstance(text, list) else text):
+                words[word] = max(words.get(word, 0), weight)
+        return values['name'] or '', words
+
+    def add(self, doc_id, document):
+        name, words = document
+        self.names[doc_id] = name
+        self.words[doc_id] = words
+        for word, weight in words.items():
+            if word not in self.postings:
+                bisect.insort(self.vocabulary, word)
+            self.postings[word][doc_id] = weight
+
+    def remove(self, doc_id):
+        self.names.pop(doc_id, None)
+        for word in self.words.pop(doc_id, {}):
+            posting = self.postings[word]
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[word]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, word)]
+
+    def clear(self):
+        self.names = {}
+        self.words = {}
+        self.postings = defaultdict(dict)
+        self.vocabulary = []
+
+    def scores(self, token):
+        """Weight of ``token`` per row; words it is only a prefix of count for half.
+
+        The result may be a posting itself, so callers must not modify it.
+        """
+        start = bisect.bisect_left(self.vocabulary, token)
+        end = bisect.bisect_left(self.vocabulary, token + '\uffff', start)
+        words = self.vocabulary[start:end]
+        if words == [token]:
+            return self.postings[token]
+        scores = {}
+        for word in words:
+            factor = 1 if word == token else 0.5
+            for doc_id, weight in self.postings[word].items():
+                weight *= factor
+                if scores.get(doc_id, 0) < weight:
+                    scores[doc_id] = weight
+        return scores
+
+
+class RankedSearch(NameSearch):
+    """Multi-word search over name, city, state and genres, best matches first.
+
+    A row matches if its name contains the whole search term (the behaviour of
+    ``NameSearch``) or if every word of the term starts a word of one of its
+    indexed fields. Rows are ranked by the summed weight of the fields matched.
+    """
+    name_weight = 8
+
+    def __init__(self, db, model):
+        super().__init__(db, model)
+        self.fields = FieldIndex(db, model)
+
+    def invalidate(self):
+        super().invalidate()
+        self.fields.invalidate()
+
+    def search(self, term, limit=None):
+        """Returns ``(count, [{'id': ..., 'name': ...}, ...])``, ranked."""
+        if self.db.engine.dialect.name == 'postgresql':
+            return self._search_ranked_sql(term, limit)
+        fields = self.fields
+        fields.ensure_built()
+        name_ids = self.matching_ids(term)
+        with fields.lock:
+            scores = self._field_scores(tokenize(term))
+            for doc_id in name_ids:
+                scores[doc_id] = scores.get(doc_id, 0) + self.name_weight
+            key = lambda doc_id: (-scores[doc_id], fields.names.get(doc_id, ''), doc_id)
+            ranked = heapq.nsmallest(limit, scores, key=key) if limit is not None else sorted(scores, key=key)
+            return len(scores), [{'id': doc_id, 'name': fields.names.get(doc_id)} for doc_id in ranked]
+
+    def _field_scores(self, tokens):
+        if not tokens:
+            return {}
+        per_token = [self.fields.scores(token) for token in tokens]
+        matched = set(min(per_token, key=len)).intersection(*per_token)
+        return {doc_id: sum(scores[doc_id] for scores in per_token) for doc_id in matched}
+
+    def _search_ranked_sql(self, term, limit):
+        tokens = tokenize(term)
+        params = {'pattern': f'%{escape_like(term)}%', 'name_weight': self.name_weight, 'limit': limit}
+        name_match = "name ILIKE :pattern ESCAPE '\\'"
+        if tokens:
+            # tokens are \w+ only, so they need no quoting inside the tsquery
+            params['query'] = ' & '.join(f'{token}:*' for token in tokens)
+            source = f""""{self.model.__tablename__}", to_tsquery('simple', :query) query"""
+            condition = f'{name_match} OR search_vector @@ query'
+            rank = 'ts_rank(search_vector, query)'
+        else:
+            source, condition, rank = f'"{self.model.__tablename__}"', name_match, '0'
+        rows = self.db.session.execute(text(f"""
+            SELECT id, name, count(*) OVER ()
+            FROM {source}
+            WHERE {condition}
+            ORDER BY CASE WHEN {name_match} THEN :name_weight ELSE 0 END + {rank} DESC, name, id
+            LIMIT :limit
+        """), params).fetchall()
+        count = rows[0][2] if rows else 0
+        return count, [{'id': doc_id, 'name': name} for doc_id, name, _ in rows]
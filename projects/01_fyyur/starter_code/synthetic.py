@@ -0,0 +1,144 @@
+"""Deterministic synthetic venues, artists and shows for load testing.
+
+Writes JSON Lines files in the format ``flask import-data`` reads (see importer.py):
+
+    $ python synthetic.py fixtures/synthetic --venues 10000 --artists 50000 --shows 1000000
+    $ flask import-data --venues fixtures/synthetic/venues.jsonl \
+        --artists fixtures/synthetic/artists.jsonl --shows fixtures/synthetic/shows.jsonl
+
+The same seed, counts and anchor date always produce the same files. Show
+popularity follows a Zipf-like distribution, so a few venues and artists get
+most of the shows, the way real catalogues look.
+"""
+import argparse
+import json
+import os
+import random
+from bisect import bisect
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+NAME_WORDS = ['The', 'Wild', 'Sax', 'Band', 'Guns', 'Petals', 'Musical', 'Hop', 'Dueling', 'Pianos',
+              'Park', 'Square', 'Live', 'Music', 'Coffee', 'Jazz', 'Blue', 'Note', 'Velvet', 'Echo',
+              'Midnight', 'Brass', 'Quartet', 'Collective', 'Orchestra', 'Club', 'Hall', 'Lounge']
+SYLLABLES = ['ka', 've', 'do', 'mi', 'ra', 'lo', 'qu', 'sen', 'tor', 'bel', 'vin', 'ost']
+CITIES = [('San Francisco', 'CA'), ('San Diego', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'),
+          ('Buffalo', 'NY'), ('Austin', 'TX'), ('Houston', 'TX'), ('Seattle', 'WA'), ('Chicago', 'IL')]
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
+          'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
+          'Rock n Roll', 'Soul', 'Other']
+
+
+@dataclass
+class Dataset:
+    venues: int = 1000
+    artists: int = 5000
+    shows: int = 100000
+    seed: int = 0
+    # share of shows in the future, relative to ``anchor``
+    upcoming_ratio: float = 0.3
+    # shows are spread over this many days either side of ``anchor``
+    days: int = 365
+    # Zipf exponent of venue and artist popularity; 0 spreads shows evenly
+    skew: float = 1.0
+    max_genres: int = 3
+    anchor: datetime = None
+
+    def __post_init__(self):
+        if self.anchor is None:
+            self.anchor = datetime.combine(datetime.now().date(), datetime.min.time())
+
+
+def made_up_name(rng):
+    return ' '.join(rng.sample(NAME_WORDS, 2) + [''.join(rng.choices(SYLLABLES, k=4)).title()])
+
+
+def owner_records(kind, count, dataset, rng):
+    """Venue or artist records, with refs ``<kind>-<n>``."""
+    for n in range(1, count + 1):
+        city, state = rng.choice(CITIES)
+        record = {
+            'ref': f'{kind}-{n}',
+            'name': made_up_name(rng),
+            'city': city,
+            'state': state,
+            'phone': f'{rng.randint(200, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}',
+            'genres': rng.sample(GENRES, rng.randint(1, dataset.max_genres)),
+            'facebook_link': f'https://www.facebook.com/{kind}{n}',
+            'seeking_description': None,
+        }
+        if kind == 'venue':
+            record['address'] = f'{rng.randint(1, 9999)} {rng.choice(NAME_WORDS)} Street'
+            record['seeking_talent'] = rng.random() < 0.3
+        else:
+            record['seeking_venue'] = rng.random() < 0.3
+        yield record
+
+
+def zipf_sampler(count, skew, rng):
+    """Draws 1..count, rank ``r`` with probability proportional to ``1 / r ** skew``."""
+    cumulative = list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+    total = cumulative[-1]
+    return lambda: bisect(cumulative, rng.random() * total) + 1
+
+
+def show_records(dataset, rng):
+    pick_venue = zipf_sampler(dataset.venues, dataset.skew, rng)
+    pick_artist = zipf_sampler(dataset.artists, dataset.skew, rng)
+    minutes = dataset.days * 24 * 60
+    seen = set()
+    while len(seen) < dataset.shows:
+        offset = rng.randrange(1, minutes)
+        if rng.random() >= dataset.upcoming_ratio:
+            offset = -offset
+        key = (pick_venue(), pick_artist(), offset)
+        if key in seen:
+            continue
+        seen.add(key)
+        venue, artist, offset = key
+        yield {
+            'venue_ref': f'venue-{venue}',
+            'artist_ref': f'artist-{artist}',
+            'start_time': (dataset.anchor + timedelta(minutes=offset)).isoformat(),
+        }
+
+
+def generate(dataset):
+    """``{'venues': records, 'artists': records, 'shows': records}``, each an iterator."""
+    return {
+        'venues': owner_records('venue', dataset.venues, dataset, random.Random(f'{dataset.seed}-venues')),
+        'artists': owner_records('artist', dataset.artists, dataset, random.Random(f'{dataset.seed}-artists')),
+        'shows': show_records(dataset, random.Random(f'{dataset.seed}-shows')),
+    }
+
+
+def write_dataset(directory, dataset):
+    """Writes venues.jsonl, artists.jsonl and shows.jsonl to ``directory`` and returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name, records in generate(dataset).items():
+        paths[name] = os.path.join(directory, f'{name}.jsonl')
+        with open(paths[name], 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+    return paths
+
+
+if __name__ == '__main__':
+    defaults = Dataset()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--venues', type=int, default=defaults.venues)
+    parser.add_argument('--artists', type=int, default=defaults.artists)
+    parser.add_argument('--shows', type=int, default=defaults.shows)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--upcoming-ratio', type=float, default=defaults.upcoming_ratio)
+    parser.add_argument('--days', type=int, default=defaults.days)
+    parser.add_argument('--skew', type=float, default=defaults.skew)
+    parser.add_argument('--anchor', type=datetime.fromisoformat, help='Reference date, defaults to today.')
+    args = parser.parse_args()
+    options = vars(args)
+    directory = options.pop('directory')
+    for name, path in write_dataset(directory, Dataset(**options)).items():
+        print(f'{name}: {path}')
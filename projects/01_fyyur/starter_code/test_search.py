@@ -0,0 +1,144 @@
+"""Tests of the in-memory venue and artist search of search.py:
+
+    $ python -m unittest test_search
+
+They run against an in-memory SQLite database, so nothing here touches the
+Postgres instance from config.py.
+"""
+import os
+import unittest
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from app import app, db, venue_search, artist_search, Venue, Artist, Genre
+from search import TrigramIndex
+
+
+def names(result):
+    count, rows = result
+    return count, [row['name'] for row in rows]
+
+
+class TrigramIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # only the in-memory structures are used, so no table is read
+        self.index = TrigramIndex(db, Venue)
+        for doc_id, name in enumerate(['The Musical Hop', 'Park Square Live Music & Coffee', 'The Dueling Pianos Bar'], 1):
+            self.index.add(doc_id, name)
+
+    def test_substring_case_insensitive(self):
+        self.assertCountEqual(self.index.matches('MUSIC'), [1, 2])
+        self.assertEqual(self.index.matches('ical h'), [1])
+        self.assertEqual(self.index.matches('jazz'), [])
+
+    def test_terms_shorter_than_a_trigram(self):
+        self.assertCountEqual(self.index.matches('Th'), [1, 3])
+        self.assertCountEqual(self.index.matches(''), [1, 2, 3])
+
+    def test_sharing_every_trigram_is_not_enough(self):
+        # 'bananana' has no trigram that 'banana' lacks
+        self.index.add(4, 'Banana Club')
+        self.assertEqual(self.index.matches('banana'), [4])
+        self.assertEqual(self.index.matches('bananana'), [])
+
+    def test_search_orders_by_name(self):
+        self.assertEqual(self.index.search('the'), (2, [
+            {'id': 3, 'name': 'The Dueling Pianos Bar'},
+            {'id': 1, 'name': 'The Musical Hop'},
+        ]))
+        self.assertEqual(self.index.search('the', limit=1), (2, [{'id': 3, 'name': 'The Dueling Pianos Bar'}]))
+
+    def test_remove(self):
+        self.index.remove(1)
+        self.index.remove(1000)
+        self.assertEqual(self.index.matches('music'), [2])
+        self.assertNotIn('hop', self.index.postings)
+
+
+class SearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        db.drop_all()
+        db.create_all()
+        venue_search.invalidate()
+        artist_search.invalidate()
+        jazz, rock = Genre(name='Jazz'), Genre(name='Rock n Roll')
+        db.session.add_all([
+            Venue(name='The Musical Hop', city='San Francisco', state='CA', genres=[jazz]),
+            Venue(name='Park Square Live Music & Coffee', city='San Francisco', state='CA', genres=[rock]),
+            Venue(name='The Dueling Pianos Bar', city='New York', state='NY', genres=[jazz]),
+            Venue(name='San Francisco Jazz Club', city='Oakland', state='CA', genres=[rock]),
+            Artist(name='The Wild Sax Band', city='San Francisco', state='CA', genres=[jazz]),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def test_name_search(self):
+        self.assertEqual(names(artist_search.search('band')), (1, ['The Wild Sax Band']))
+        # both names contain 'music', but only one has it as a whole word
+        self.assertEqual(names(venue_search.search('music', limit=1)), (2, ['Park Square Live Music & Coffee']))
+
+    def test_ranked_search(self):
+        # words match across fields and as prefixes of words, weighted by field
+        self.assertEqual(names(venue_search.search('francisco ja')),
+                         (2, ['San Francisco Jazz Club', 'The Musical Hop']))
+        self.assertEqual(names(venue_search.search('jazz ny')), (1, ['The Dueling Pianos Bar']))
+        self.assertEqual(names(venue_search.search('jazz opera')), (0, []))
+
+    def test_ranked_search_prefers_names(self):
+        count, venues = names(venue_search.search('san francisco jazz'))
+        self.assertEqual(venues[0], 'San Francisco Jazz Club')
+        self.assertEqual(count, 2)
+        # a whole name match outranks matches on city and state alone
+        count, venues = names(venue_search.search('san francisco'))
+        self.assertEqual(venues[0], 'San Francisco Jazz Club')
+        self.assertEqual(count, 3)
+
+    def test_follows_inserts(self):
+        venue_search.search('blue')
+        db.session.add(Venue(name='Blue Note', city='New York', state='NY', genres=Genre.named(['Jazz'])))
+        db.session.commit()
+        self.assertEqual(names(venue_search.search('blue')), (1, ['Blue Note']))
+        self.assertEqual(names(venue_search.search('jazz ny')), (2, ['Blue Note', 'The Dueling Pianos Bar']))
+
+    def test_follows_renames(self):
+        venue_search.search('hop')
+        venue = Venue.query.filter_by(name='The Musical Hop').one()
+        venue.name = 'The Jazz Cellar'
+        db.session.commit()
+        self.assertEqual(names(venue_search.search('hop')), (0, []))
+        self.assertEqual(names(venue_search.search('musical')), (0, []))
+        self.assertEqual(names(venue_search.search('cellar')), (1, ['The Jazz Cellar']))
+
+    def test_follows_genre_changes(self):
+        venue_search.search('rock')
+        venue = Venue.query.filter_by(name='The Dueling Pianos Bar').one()
+        venue.genres = Genre.named(['Rock n Roll'])
+        db.session.commit()
+        self.assertEqual(names(venue_search.search('rock ny')), (1, ['The Dueling Pianos Bar']))
+        self.assertEqual(names(venue_search.search('jazz ny')), (0, []))
+
+    def test_follows_deletes(self):
+        venue_search.search('hop')
+        db.session.delete(Venue.query.filter_by(name='The Musical Hop').one())
+        db.session.commit()
+        self.assertEqual(names(venue_search.search('hop')), (0, []))
+        self.assertEqual(names(venue_search.search('music')), (1, ['Park Square Live Music & Coffee']))
+
+    def test_ignores_rolled_back_writes(self):
+        venue_search.search('blue')
+        db.session.add(Venue(name='Blue Note', city='New York', state='NY'))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(names(venue_search.search('blue')), (0, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
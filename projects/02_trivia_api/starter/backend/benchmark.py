@@ -0,0 +1,119 @@
+"""Benchmarks for the trivia API's data access paths.
+
+Everything runs against a throwaway in-memory SQLite database, so nothing here
+touches the Postgres database from models.py:
+
+    $ python benchmark.py quizzes --sizes 10000 1000000 --previous 500
+    $ python benchmark.py export --sizes 10000 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+import tracemalloc
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flaskr import create_app, question_pool
+from models import db, Question, Category
+from query_stats import recording
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+
+
+def reset_database():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    question_pool.invalidate()
+
+
+def seed_questions(num_questions):
+    db.session.execute(Category.__table__.insert(), [{'id': i, 'type': name} for i, name in enumerate(CATEGORIES, 1)])
+    for start in range(0, num_questions, 100000):
+        db.session.execute(Question.__table__.insert(), [{
+            'id': i,
+            'question': f'Question {i}?',
+            'answer': f'Answer {i}',
+            'category': str(i % len(CATEGORIES) + 1),
+            'difficulty': i % 5 + 1,
+        } for i in range(start + 1, min(start + 100000, num_questions) + 1)])
+    db.session.commit()
+
+
+def legacy_pick(category_id, previous_questions):
+    """/quizzes as it was before quiz.py: loads and formats every eligible question to pick one."""
+    category = Category.query.get(category_id)
+    questions = Question.query.filter_by(category=str(category_id)) if category else Question.query
+    questions = [q.format() for q in questions.filter(Question.id.notin_(previous_questions))]
+    return random.choice(questions) if questions else None
+
+
+def bench_quizzes(sizes, previous=500, repeat=20):
+    """Latency of /quizzes for "All" and one category, with ``previous`` questions already played."""
+    app = create_app()
+    client = app.test_client()
+    rng = random.Random(0)
+    print(f'{"questions":>10} {"category":>9} {"implementation":>15} {"queries":>8} {"median ms":>10} {"max ms":>10}')
+    with app.app_context():
+        for size in sizes:
+            reset_database()
+            seed_questions(size)
+            start = time.perf_counter()
+            question_pool.category_ids()
+            print(f'{size:>10} {"":>9} {"(pool build)":>15} {"":>8} {(time.perf_counter() - start) * 1000:>10.1f}')
+            for category in (0, 3):
+                played = rng.sample(range(1, size + 1), min(previous, size))
+                body = {'previous_questions': played, 'quiz_category': {'id': category}}
+                cases = [
+                    ('legacy', lambda: legacy_pick(category, played)),
+                    ('pool', lambda: client.post('/quizzes', json=body)),
+                ]
+                for label, run in cases:
+                    timings = []
+                    for _ in range(repeat if label == 'pool' or size <= 100000 else 3):
+                        db.session.remove()
+                        with recording() as counter:
+                            start = time.perf_counter()
+                            run()
+                            timings.append((time.perf_counter() - start) * 1000)
+                    print(f'{size:>10} {category or "all":>9} {label:>15} {counter.count:>8} '
+                          f'{statistics.median(timings):>10.2f} {max(timings):>10.2f}')
+
+
+def bench_export(sizes):
+    """Time and peak Python memory of streaming /questions/export, which should not grow with the table."""
+    app = create_app()
+    client = app.test_client()
+    print(f'{"questions":>10} {"format":>7} {"MB out":>8} {"seconds":>8} {"peak MB":>8}')
+    with app.app_context():
+        for size in sizes:
+            reset_database()
+            seed_questions(size)
+            for export_format in ('jsonl', 'csv'):
+                db.session.remove()
+                tracemalloc.start()
+                start = time.perf_counter()
+                response = client.get(f'/questions/export?format={export_format}', buffered=False)
+                written = sum(len(chunk) for chunk in response.response)
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f'{size:>10} {export_format:>7} {written / 2 ** 20:>8.1f} {elapsed:>8.1f} {peak / 2 ** 20:>8.1f}')
+
+
+BENCHMARKS = {
+    'quizzes': bench_quizzes,
+    'export': bench_export,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--previous', type=int, default=500, help='Questions already played, for the quizzes benchmark.')
+    args = parser.parse_args()
+    options = {'previous': args.previous} if args.benchmark == 'quizzes' else {}
+    BENCHMARKS[args.benchmark](args.sizes, **options)
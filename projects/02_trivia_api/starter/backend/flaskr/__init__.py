@@ -1,42 +1,73 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, Response, request, abort, jsonify, stream_with_context, url_for
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 from models import db
 import logging
-import random
 
 from models import setup_db, Question, Category
+from query_stats import QueryStats
+from .paging import CountCache, count_rows, fetch_page
+from .bulk import ImportFailed, export_questions, import_questions, read_records
+from .categories import CategoryCache
+from .quiz import QuestionPool
+from .search import QuestionSearch
+from .quiz_sessions import MemoryStore, QuizSession, new_session_id
 
 QUESTIONS_PER_PAGE = 10
 
 
-def paginate(objs, page, page_size=QUESTIONS_PER_PAGE):
-    start = (page - 1) * page_size
-    return objs[start: start + page_size]
+question_counts = CountCache(Question)
+question_pool = QuestionPool(db, Question)
+category_cache = CategoryCache(Category)
+question_search = QuestionSearch(db, Question)
 
 
-def get_formatted_question(questions, page=None):
-    formatted_questions = [q.format() for q in questions]
-    if page is None:
-        paginated_questions = formatted_questions
-    else:
-        paginated_questions = paginate(formatted_questions, page)
-    return len(formatted_questions), paginated_questions
+def return_preference(prefer_header):
+    """``'minimal'`` or ``'representation'`` if requested through a ``Prefer`` header (RFC 7240), else None."""
+    for preference in (prefer_header or '').split(','):
+        name, _, value = preference.partition('=')
+        value = value.split(';')[0].strip().strip('"')
+        if name.strip().lower() == 'return' and value in ('minimal', 'representation'):
+            return value
+    return None
+
+
+def delete_question_ids(ids, chunk_size=1000):
+    """Deletes the questions with these ids in the current transaction; returns ``(deleted, missing ids)``.
+
+    Ids go in chunks, as databases cap the number of parameters of a statement.
+    """
+    ids = sorted(ids)
+    deleted = 0
+    found = set()
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        found.update(question_id for question_id, in db.session.query(Question.id).filter(Question.id.in_(chunk)))
+        deleted += Question.query.filter(Question.id.in_(chunk)).delete(synchronize_session=False)
+    return deleted, [question_id for question_id in ids if question_id not in found]
 
 
 def get_category_map():
-    categories = Category.query.all()
-    category_json = {}
-    for cat in categories:
-        category_json[cat.id] = cat.type
-    return category_json
+    return category_cache.category_map()
+
+
+def list_questions_response(query, page, current_category, count_key=None, after=None):
+    """One page of ``query``; its total is cached under ``count_key``, if given."""
+    if page < 1:
+        abort(404)
+    questions = fetch_page(query, Question.id, page=page, after=after, page_size=QUESTIONS_PER_PAGE)
+
+    if not questions:
+        abort(404)
 
+    total_questions = question_counts.count(count_key, query) if count_key is not None else count_rows(query)
+    return questions_response(questions, total_questions, current_category)
 
-def list_questions_response(questions, page, current_category):
-    total_questions, paginated_questions = get_formatted_question(questions, page)
 
-    if not paginated_questions:
+def questions_response(questions, total_questions, current_category):
+    if not questions:
         abort(404)
 
     # build categories map
@@ -44,7 +75,7 @@ def list_questions_response(questions, page, current_category):
 
     return jsonify({
         "success": True,
-        'questions': paginated_questions,
+        'questions': [q.format() for q in questions],
         'total_questions': total_questions,
         'categories': category_json,
         'current_category': current_category
@@ -54,7 +85,18 @@ def list_questions_response(questions, page, current_category):
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
+    app.config.from_mapping(
+        # seconds a quiz session is kept after its last question
+        QUIZ_SESSION_TTL=3600,
+        # replaces the in-process store, see quiz_sessions.py
+        QUIZ_SESSION_STORE=None,
+    )
+    if test_config:
+        app.config.update(test_config)
     setup_db(app)
+    question_search.setup()
+    QueryStats(app)
+    quiz_sessions = app.config['QUIZ_SESSION_STORE'] or MemoryStore(ttl=app.config['QUIZ_SESSION_TTL'])
 
     '''
     @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -66,7 +108,8 @@ def create_app(test_config=None):
     '''
     @app.after_request
     def after_request(response):
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,true')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Prefer,true')
+        response.headers.add('Access-Control-Expose-Headers', 'Location,Preference-Applied')
         response.headers.add('Access-Control-Allow-Methods', 'GET,PATCH,POST,DELETE,OPTIONS')
         return response
 
@@ -76,12 +119,11 @@ def create_app(test_config=None):
     for all available categories.
     '''
     @app.route('/categories')
+    @QueryStats.budget(1)
     def get_categories():
-        categories = Category.query.all()
-        category_json = {}
-        for cat in categories:
-            category_json[cat.id] = cat.type
-        return jsonify({'categories': category_json})
+        response = jsonify({'categories': get_category_map()})
+        response.set_etag(category_cache.etag)
+        return response.make_conditional(request)
 
     '''
     @TODO: 
@@ -124,6 +166,41 @@ def create_app(test_config=None):
             "success": True
         })
 
+    @app.route('/questions', methods=['DELETE'])
+    def delete_questions():
+        body = request.get_json(silent=True) or {}
+        ids = body.get('ids')
+        category = body.get('category')
+        if (ids is None) == (category is None):
+            abort(400)
+        if ids is not None and not (isinstance(ids, list) and
+                                    all(isinstance(i, int) and not isinstance(i, bool) for i in ids)):
+            abort(400)
+        if category is not None and category_cache.format(category) is None:
+            abort(404)
+        try:
+            if ids is not None:
+                deleted, missing = delete_question_ids(set(ids))
+            else:
+                deleted = Question.query.filter_by(category=category_cache.format(category)['id']) \
+                    .delete(synchronize_session=False)
+                missing = []
+            db.session.commit()
+        except Exception as e:
+            logging.error(str(e))
+            db.session.rollback()
+            abort(400)
+        finally:
+            db.session.close()
+            # deleted around the ORM, so its write events never fired
+            question_counts.invalidate()
+            question_pool.invalidate()
+        return jsonify({
+            'success': True,
+            'deleted': deleted,
+            'missing': missing
+        })
+
     '''
     @TODO: 
     Create an endpoint to POST a new question, 
@@ -142,12 +219,78 @@ def create_app(test_config=None):
             question = Question(**request.json)
             db.session.add(question)
             db.session.commit()
+            created_question = question.format()
+        except HTTPException:
+            # e.g. the 404 of search_question for a page out of range
+            raise
         except Exception as e:
             logging.error(str(e))
             abort(400)
         finally:
             db.session.close()
-        return get_questions()
+
+        # the full listing stays the default, as the frontend relies on it
+        preference = return_preference(request.headers.get('Prefer'))
+        if preference is None:
+            return get_questions()
+        if preference == 'minimal':
+            response = Response(status=201)
+        else:
+            response = jsonify({
+                'success': True,
+                'question': created_question
+            })
+            response.status_code = 201
+        response.headers['Location'] = url_for('get_question', question_id=created_question['id'])
+        response.headers['Preference-Applied'] = f'return={preference}'
+        return response
+
+    @app.route('/questions/<int:question_id>')
+    def get_question(question_id):
+        question = Question.query.get(question_id)
+        if not question:
+            abort(404)
+        return jsonify({
+            'success': True,
+            'question': question.format()
+        })
+
+    @app.route('/questions/bulk', methods=['POST'])
+    def import_question_batch():
+        records = read_records(request.stream, request.mimetype)
+        try:
+            inserted, rejected, errors = import_questions(db, Question, records, set(get_category_map()))
+        except ImportFailed as e:
+            logging.error(f'{e}: {e.__cause__}')
+            # earlier batches are committed, so the client needs to know which
+            return jsonify({
+                'success': False,
+                'error': 400,
+                'message': 'Import failed, rows before the failure were inserted',
+                'inserted': e.inserted,
+                'rejected': e.rejected,
+                'errors': e.errors
+            }), 400
+        finally:
+            # rows inserted around the ORM, so its write events never fired
+            question_counts.invalidate()
+            question_pool.invalidate()
+        return jsonify({
+            'success': True,
+            'inserted': inserted,
+            'rejected': rejected,
+            'errors': errors
+        })
+
+    @app.route('/questions/export')
+    def export_question_table():
+        export_format = request.args.get('format', 'jsonl')
+        if export_format not in ('jsonl', 'csv'):
+            abort(400)
+        return Response(
+            stream_with_context(export_questions(db, Question, export_format)),
+            mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+            headers={'Content-Disposition': f'attachment; filename=questions.{export_format}'})
 
     '''
     @TODO: 
@@ -163,8 +306,11 @@ def create_app(test_config=None):
     @app.route('/questions', methods=['POST'])
     def search_question():
         search_term = request.json['searchTerm']
-        questions = Question.query.filter(Question.question.contains(search_term)).order_by(Question.id).all()
-        return list_questions_response(questions, 1, None)
+        page = request.json.get('page', 1)
+        if not isinstance(page, int) or page < 1:
+            abort(404)
+        total_questions, questions = question_search.search(search_term, page, QUESTIONS_PER_PAGE)
+        return questions_response(questions, total_questions, None)
 
     '''
     @TODO: 
@@ -178,13 +324,17 @@ def create_app(test_config=None):
     @app.route('/categories/<int:category_id>/questions')
     def get_questions_by_category(category_id):
         page = request.args.get('page', 1, type=int)
+        # id of the last question of the previous page, for keyset pagination
+        after = request.args.get('after', None, type=int)
 
         # get filtered questions
-        current_category = Category.query.get(category_id).format() if category_id else None
+        current_category = category_cache.format(category_id) if category_id else None
+        if category_id and current_category is None:
+            abort(404)
         question_filter_query = Question.query.filter_by(category=category_id) if category_id else Question.query
-        questions = question_filter_query.order_by(Question.id).all()
 
-        return list_questions_response(questions, page, current_category)
+        return list_questions_response(question_filter_query, page, current_category,
+                                       count_key=('category', category_id), after=after)
 
     '''
     @TODO: 
@@ -199,20 +349,39 @@ def create_app(test_config=None):
     '''
     @app.route('/quizzes', methods=['POST'])
     def post_quizzes():
-        previous_questions = request.json['previous_questions']
+        if request.json.get('session_id') is not None:
+            return next_session_question(request.json['session_id'])
+        previous_questions = set(request.json['previous_questions'])
         quiz_category = request.json['quiz_category']
-        category = Category.query.get(quiz_category['id'])
-        if not category:
-            questions = Question.query
-        else:
-            questions = Question.query.filter_by(category=quiz_category['id'])
-        questions = questions.filter(Question.id.notin_(previous_questions))
-        total, formatted_questions = get_formatted_question(questions)
+        category = category_cache.format(quiz_category['id'])
+        question = question_pool.pick(category['id'] if category else None, exclude=previous_questions)
+        return jsonify({
+            'question': question.format() if question else None
+        })
 
-        random_question_idx = random.randint(0, total - 1) if total > 0 else None
-        random_question = formatted_questions[random_question_idx] if random_question_idx is not None else None
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        quiz_category = (request.get_json(silent=True) or {}).get('quiz_category') or {}
+        category = category_cache.format(quiz_category.get('id'))
+        session_id = new_session_id()
+        quiz_sessions.set(session_id, QuizSession(category['id'] if category else None))
+        return jsonify({
+            'success': True,
+            'session_id': session_id
+        }), 201
+
+    def next_session_question(session_id):
+        with quiz_sessions.locked(session_id):
+            session = quiz_sessions.get(session_id)
+            if session is None:
+                abort(404)
+            question = question_pool.pick(session.category, exclude=session.seen)
+            if question:
+                session.seen.add(question.id)
+                quiz_sessions.set(session_id, session)
         return jsonify({
-            'question': random_question
+            'question': question.format() if question else None,
+            'session_id': session_id
         })
 
     '''
@@ -0,0 +1,136 @@
+"""Bulk import and export of questions.
+
+Imports read the request body as a stream, JSON Lines or CSV with a header
+row, and insert valid rows ``BATCH_SIZE`` at a time, one transaction per batch.
+Invalid rows are skipped and reported with their line number, so a client can
+fix and resend just those. If an import fails partway (an unreadable body, a
+database error), the batches before the failure stay inserted and
+``ImportFailed`` says how far it got.
+
+Exports stream rows from a server-side cursor (a named cursor on Postgres), so
+memory use does not grow with the size of the table.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+BATCH_SIZE = 1000
+# invalid rows reported in an import response; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+FIELDS = ('question', 'answer', 'category', 'difficulty')
+DIFFICULTIES = range(1, 6)
+
+
+def read_records(stream, content_type):
+    """Yields ``(line number, record)`` from a CSV (``text/csv``) or JSON Lines body."""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if content_type == 'text/csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_num, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_num, ValueError(f'invalid JSON: {e}')
+            continue
+        yield line_num, record
+
+
+def validate(record, category_ids):
+    """The row to insert for ``record``; raises ValueError describing what is wrong with it."""
+    if isinstance(record, ValueError):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError('expected an object')
+    row = {}
+    for field in ('question', 'answer'):
+        value = record.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f'{field} must be a non-empty string')
+        row[field] = value
+    for field, allowed in (('category', category_ids), ('difficulty', DIFFICULTIES)):
+        value = record.get(field)
+        try:
+            # int() alone would turn 2.9 into 2 and true into 1
+            if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+                raise ValueError
+            row[field] = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be an integer') from None
+        if row[field] not in allowed:
+            raise ValueError(f'unknown {field} {row[field]}')
+    return row
+
+
+class ImportFailed(Exception):
+    """An import stopped partway; ``inserted`` rows were committed before it did."""
+
+    def __init__(self, inserted, rejected, errors):
+        super().__init__(f'import failed after {inserted} rows were inserted')
+        self.inserted = inserted
+        self.rejected = rejected
+        self.errors = errors
+
+
+def import_questions(db, model, records, category_ids, batch_size=BATCH_SIZE):
+    """Inserts the valid records; returns ``(inserted, rejected, errors)``, or raises ``ImportFailed``."""
+    inserted = rejected = 0
+    errors = []
+    batch = []
+    try:
+        for line_num, record in records:
+            try:
+                batch.append(validate(record, category_ids))
+            except ValueError as e:
+                rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'line': line_num, 'message': str(e)})
+                continue
+            if len(batch) >= batch_size:
+                inserted += insert_batch(db, model, batch)
+                batch = []
+        if batch:
+            inserted += insert_batch(db, model, batch)
+    except Exception as e:
+        raise ImportFailed(inserted, rejected, errors) from e
+    return inserted, rejected, errors
+
+
+def insert_batch(db, model, rows):
+    try:
+        db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows)
+
+
+def export_questions(db, model, format='jsonl', chunk_size=BATCH_SIZE):
+    """Yields the body of an export of every question, ``chunk_size`` rows at a time."""
+    table = model.__table__
+    columns = [table.c.id] + [table.c[field] for field in FIELDS]
+    result = db.session.connection(execution_options={'stream_results': True}) \
+        .execute(select(columns).order_by(table.c.id))
+    try:
+        if format == 'csv':
+            yield ','.join(column.name for column in columns) + '\r\n'
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            if format == 'csv':
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                yield buffer.getvalue()
+            else:
+                yield ''.join(json.dumps(dict(row)) + '\n' for row in rows)
+    finally:
+        result.close()
+        db.session.close()
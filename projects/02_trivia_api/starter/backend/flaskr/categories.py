@@ -0,0 +1,56 @@
+"""In-process cache of the category map.
+
+Categories are read by nearly every request and almost never change, so they
+are loaded once and kept until categories are written through the ORM, or at
+most ``ttl`` seconds, which bounds how long writes made by other processes go
+unseen. Anything else writing categories should call ``invalidate()``.
+
+Each load gets a new ``version``, and an ``etag`` derived from the contents, so
+clients can revalidate /categories with If-None-Match across server processes.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from .caching import invalidate_on_write
+
+
+class CategoryCache:
+
+    def __init__(self, model, ttl=300, clock=time.monotonic):
+        self.model = model
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.version = 0
+        self.etag = None
+        self._types = None
+        self._loaded_at = None
+        invalidate_on_write(model, self)
+
+    def invalidate(self):
+        with self.lock:
+            self._types = None
+
+    def category_map(self):
+        """``{id: type}`` of every category; shared, so callers must not modify it."""
+        with self.lock:
+            if self._types is None or self.clock() - self._loaded_at >= self.ttl:
+                self._load()
+            return self._types
+
+    def format(self, category_id):
+        """``Category.format()`` of the category, or None if there is no such category."""
+        try:
+            category_id = int(category_id)
+        except (TypeError, ValueError):
+            return None
+        category_type = self.category_map().get(category_id)
+        return {'id': category_id, 'type': category_type} if category_type is not None else None
+
+    def _load(self):
+        self._types = {category.id: category.type for category in self.model.query.order_by(self.model.id)}
+        self._loaded_at = self.clock()
+        self.version += 1
+        self.etag = hashlib.sha1(json.dumps(sorted(self._types.items())).encode()).hexdigest()
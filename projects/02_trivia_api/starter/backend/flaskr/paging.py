@@ -0,0 +1,61 @@
+"""Pagination of question listings in SQL.
+
+Only the rows of the requested page are loaded (and formatted), through
+LIMIT/OFFSET. Listing totals come from a COUNT cached per listing and dropped
+whenever rows of the model are written through the ORM (see caching.py), or
+after at most ``ttl`` seconds, which bounds how long writes made by other
+processes or around the ORM go unseen.
+
+OFFSET still walks every skipped row, so deep pages get slower the deeper they
+are. Clients paging through everything can instead pass the id of the last row
+they received (``?after=<id>``), which seeks straight to the next page through
+the primary key index.
+"""
+import threading
+import time
+
+from .caching import invalidate_on_write
+
+
+def fetch_page(query, key_column, page=1, after=None, page_size=10):
+    """Rows of ``page``, or the ``page_size`` rows after ``key_column`` value ``after``, ordered by ``key_column``."""
+    query = query.order_by(key_column)
+    if after is not None:
+        return query.filter(key_column > after).limit(page_size).all()
+    return query.limit(page_size).offset((page - 1) * page_size).all()
+
+
+def count_rows(query):
+    return query.order_by(None).count()
+
+
+class CountCache:
+    """Row counts of queries over one model, keyed by the caller, invalidated by writes to the model."""
+
+    def __init__(self, model, ttl=60, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.counts = {}
+        self.generation = 0
+        self.lock = threading.Lock()
+        invalidate_on_write(model, self)
+
+    def count(self, key, query):
+        now = self.clock()
+        with self.lock:
+            if key in self.counts:
+                count, counted_at = self.counts[key]
+                if now - counted_at < self.ttl:
+                    return count
+            generation = self.generation
+        count = count_rows(query)
+        with self.lock:
+            # a write while counting makes the result stale, so it is returned but not kept
+            if generation == self.generation:
+                self.counts[key] = (count, now)
+        return count
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.counts.clear()
@@ -0,0 +1,152 @@
+"""Random quiz question selection without loading the candidate questions.
+
+``QuestionPool`` keeps the ids of every question in memory, grouped by
+category (a few bytes per question, so about 10MB per million questions in
+CPython lists). Picking a question draws random ids from the right group and
+skips those the player already had. When most of the group has been played it
+scans what is left instead. Only the chosen question is then loaded.
+
+The pool is built from the table on first use. Questions inserted, deleted
+or moved to another category through the ORM are applied to it once
+committed (see caching.py), so writes cost no rebuild. As a safety net it is
+rebuilt at most ``ttl`` seconds after it was built, so that questions added
+by other processes or around the ORM are picked up, and straight away when a
+picked id's question has since been deleted.
+
+Changed groups are replaced by updated copies rather than changed in place,
+as picks read them without the lock.
+"""
+import bisect
+import random
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import inspect
+
+from .caching import apply_on_commit
+
+# Random draws tried before scanning for the remaining ids. The chance that
+# every draw hits a played question is (played share) ** MAX_DRAWS, so below
+# about 80% played the scan almost never happens.
+MAX_DRAWS = 32
+
+
+class QuestionPool:
+
+    def __init__(self, db, model, rng=None, ttl=60, clock=time.monotonic):
+        self.db = db
+        self.model = model
+        self.rng = rng or random.Random()
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.ids = None
+        self._loaded_at = None
+        apply_on_commit(model, self)
+
+    def invalidate(self):
+        with self.lock:
+            self.ids = None
+
+    def change(self, operation, question):
+        """``(id, groups it leaves, groups it joins)`` of a written question, or None if its groups stay the same.
+
+        The groups it leaves are None, for all of them, when its old category was not loaded.
+        """
+        if operation == 'insert':
+            return question.id, (), (None, str(question.category))
+        state = inspect(question)
+        if operation == 'delete':
+            if 'category' not in state.dict:
+                return question.id, None, ()
+            return question.id, (None, str(state.dict['category'])), ()
+        history = state.attrs.category.history
+        if not history.added:
+            return None
+        category = str(history.added[0])
+        if not history.deleted:
+            return question.id, None, (None, category)
+        if str(history.deleted[0]) == category:
+            return None
+        return question.id, (str(history.deleted[0]),), (category,)
+
+    def apply(self, changes):
+        """Applies committed ``change()`` results; ids already in, or already out, are left alone."""
+        with self.lock:
+            if self.ids is None:
+                return
+            ids = dict(self.ids)
+            copied = set()
+
+            def group(key):
+                if key not in copied:
+                    ids[key] = list(ids.get(key, ()))
+                    copied.add(key)
+                return ids[key]
+
+            for question_id, left, joined in changes:
+                for key in left if left is not None else list(ids):
+                    _remove(group(key), question_id)
+                for key in joined:
+                    _insert(group(key), question_id)
+            self.ids = ids
+
+    def category_ids(self, category=None):
+        """Ids of the questions of ``category``, or of all questions when it is None.
+
+        The returned list is shared by later calls, so callers must not modify it.
+        """
+        with self.lock:
+            if self.ids is None or self.clock() - self._loaded_at >= self.ttl:
+                self.ids = self._load()
+                self._loaded_at = self.clock()
+            return self.ids.get(None if category is None else str(category), [])
+
+    def _load(self):
+        ids = defaultdict(list)
+        everything = ids[None]
+        query = self.db.session.query(self.model.id, self.model.category).order_by(self.model.id)
+        for question_id, category in query.yield_per(10000):
+            everything.append(question_id)
+            ids[str(category)].append(question_id)
+        return dict(ids)
+
+    def pick_id(self, category=None, exclude=frozenset()):
+        """A random question id of ``category`` not in ``exclude``, or None if there is none left.
+
+        ``exclude`` is a set, or anything else answering ``in`` and ``len()`` as fast.
+        """
+        ids = self.category_ids(category)
+        if len(exclude) < len(ids):
+            for _ in range(MAX_DRAWS):
+                question_id = ids[self.rng.randrange(len(ids))]
+                if question_id not in exclude:
+                    return question_id
+        remaining = [question_id for question_id in ids if question_id not in exclude]
+        return self.rng.choice(remaining) if remaining else None
+
+    def pick(self, category=None, exclude=frozenset()):
+        """A random question of ``category`` not in ``exclude``, or None."""
+        for _ in range(2):
+            question_id = self.pick_id(category, exclude)
+            if question_id is None:
+                return None
+            question = self.model.query.get(question_id)
+            if question is not None:
+                return question
+            # deleted by another process or around the ORM since the pool was built
+            self.invalidate()
+        return None
+
+
+def _insert(ids, question_id):
+    index = bisect.bisect_left(ids, question_id)
+    if index == len(ids) or ids[index] != question_id:
+        ids.insert(index, question_id)
+
+
+def _remove(ids, question_id):
+    index = bisect.bisect_left(ids, question_id)
+    if index < len(ids) and ids[index] == question_id:
+        del ids[index]
@@ -0,0 +1,128 @@
+"""Server-side quiz sessions, so players don't resend every question they had.
+
+A session remembers the quiz category and the questions already asked, as a
+bitmap over question ids: one bit per id up to the highest id seen, so 125KB
+at worst for a million questions, and usually much less.
+
+Sessions live in a store, ``MemoryStore`` by default. It keeps them in this
+process and drops them ``ttl`` seconds after their last use, or the least
+recently used ones once ``max_sessions`` is reached. Any object with the same
+``get`` / ``set`` / ``delete`` / ``locked`` methods can replace it, e.g. one
+backed by Redis for apps running several processes. Such stores should keep
+``QuizSession.dumps()`` rather than the object itself, and ``locked`` must
+then hold a lock shared by the processes (e.g. a Redis lock on the id).
+
+Updating a session reads it, picks a question and writes it back, so callers
+hold ``locked(session_id)`` around all three; otherwise two requests of the
+same session could both be given the same question, or one could undo the
+other's update.
+"""
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Bitmap:
+    """A set of non-negative integers, one bit each."""
+
+    def __init__(self, data=b''):
+        self.data = bytearray(data)
+        self.count = sum(bin(byte).count('1') for byte in self.data)
+
+    def add(self, value):
+        index, bit = divmod(value, 8)
+        if index >= len(self.data):
+            self.data.extend(bytes(index + 1 - len(self.data)))
+        if not self.data[index] & 1 << bit:
+            self.data[index] |= 1 << bit
+            self.count += 1
+
+    def __contains__(self, value):
+        index, bit = divmod(value, 8)
+        return 0 <= index < len(self.data) and bool(self.data[index] & 1 << bit)
+
+    def __len__(self):
+        return self.count
+
+
+class QuizSession:
+
+    def __init__(self, category=None, seen=None):
+        self.category = category
+        self.seen = seen if seen is not None else Bitmap()
+
+    def dumps(self):
+        return json.dumps({'category': self.category, 'seen': self.seen.data.hex()})
+
+    @classmethod
+    def loads(cls, data):
+        data = json.loads(data)
+        return cls(data['category'], Bitmap(bytes.fromhex(data['seen'])))
+
+
+class MemoryStore:
+    """In-process session store with expiry ``ttl`` seconds after last use."""
+
+    def __init__(self, ttl=3600, max_sessions=100000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self.lock = threading.Lock()
+        # least recently used first, which is also the order of expiry
+        self.sessions = OrderedDict()
+        # session id -> [lock, number of requests holding or waiting for it]
+        self.session_locks = {}
+
+    def get(self, session_id):
+        with self.lock:
+            self._evict()
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return None
+            self.sessions[session_id] = (self.clock() + self.ttl, entry[1])
+            self.sessions.move_to_end(session_id)
+            return entry[1]
+
+    def set(self, session_id, session):
+        with self.lock:
+            self._evict()
+            self.sessions[session_id] = (self.clock() + self.ttl, session)
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+    def delete(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    @contextmanager
+    def locked(self, session_id):
+        """Hold ``session_id`` for a read-modify-write; other requests for the same session wait."""
+        with self.lock:
+            entry = self.session_locks.get(session_id)
+            if entry is None:
+                entry = self.session_locks[session_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.session_locks[session_id]
+
+    def _evict(self):
+        now = self.clock()
+        while self.sessions:
+            session_id, (expires, _) = next(iter(self.sessions.items()))
+            if expires > now:
+                break
+            del self.sessions[session_id]
+
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
@@ -0,0 +1,133 @@
+"""Ranked full-text search over question and answer text.
+
+Every word of the search term has to start a word of the question or of its
+answer, case-insensitively; matches in the question rank above matches in the
+answer.
+
+On Postgres this runs against the ``search_vector`` column and GIN index
+created by question_search.sql. The column is maintained by a trigger and
+deliberately not mapped on the model, so the ORM never reads or writes it.
+Both the column and the query use the 'simple' configuration, which keeps
+every word: with 'english', stop words such as "the" or "who" were dropped
+and a term made only of them matched nothing.
+On SQLite (tests, benchmarks) ``setup()`` creates an FTS5 index kept in step
+by triggers. Other databases fall back to an unranked LIKE scan.
+"""
+import re
+
+from sqlalchemy import text
+
+FTS_TABLE = 'questions_fts'
+
+
+def tokenize(term):
+    return re.findall(r'\w+', term.lower())
+
+
+class QuestionSearch:
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+
+    @property
+    def dialect(self):
+        return self.db.engine.dialect.name
+
+    def setup(self):
+        """Creates the SQLite full-text index, if missing; Postgres gets it from question_search.sql."""
+        if self.dialect != 'sqlite':
+            return
+        table = self.model.__tablename__
+        names = {FTS_TABLE} | {f'{FTS_TABLE}_{operation}' for operation in ('insert', 'delete', 'update')}
+        with self.db.engine.connect() as connection:
+            existing = {name for name, in connection.execute(
+                text("SELECT name FROM sqlite_master WHERE name LIKE :prefix"), {'prefix': f'{FTS_TABLE}%'})}
+        # the triggers keep an existing index current, so it is only rebuilt when something was missing
+        if names <= existing:
+            return
+        statements = [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(question, answer, content='{table}', content_rowid='id')",
+            f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {FTS_TABLE}(rowid, question, answer) VALUES (new.id, new.question, new.answer);
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, question, answer) VALUES ('delete', old.id, old.question, old.answer);
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE ON {table} BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, question, answer) VALUES ('delete', old.id, old.question, old.answer);
+                INSERT INTO {FTS_TABLE}(rowid, question, answer) VALUES (new.id, new.question, new.answer);
+            END""",
+            # indexes whatever the table holds, which writes made without the triggers may have changed
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+        ]
+        with self.db.engine.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+
+    def search(self, term, page=1, page_size=10):
+        """Returns ``(total, questions)``, the questions of ``page``, best matches first."""
+        tokens = tokenize(term)
+        offset = (page - 1) * page_size
+        if not tokens:
+            query = self.model.query
+            return query.count(), query.order_by(self.model.id).limit(page_size).offset(offset).all()
+        if self.dialect == 'postgresql':
+            return self._search_postgres(tokens, page_size, offset)
+        if self.dialect == 'sqlite':
+            return self._search_sqlite(tokens, page_size, offset)
+        return self._search_like(tokens, page_size, offset)
+
+    def _search_postgres(self, tokens, limit, offset):
+        table = self.model.__tablename__
+        # tokens are \w+ only, so they need no quoting inside the tsquery
+        params = {'query': ' & '.join(f'{token}:*' for token in tokens)}
+        rows = self.db.session.execute(text(f"""
+            SELECT id, count(*) OVER ()
+            FROM {table}, to_tsquery('simple', :query) query
+            WHERE search_vector @@ query
+            ORDER BY ts_rank(search_vector, query) DESC, id
+            LIMIT :limit OFFSET :offset
+        """), dict(params, limit=limit, offset=offset)).fetchall()
+        if rows:
+            return self._load(rows)
+        # the page is past the last match, nothing matches, or the parser kept
+        # nothing of the tokens (e.g. underscores only), which would match nothing
+        nodes, total = self.db.session.execute(text(f"""
+            SELECT numnode(query), (SELECT count(*) FROM {table} WHERE search_vector @@ query)
+            FROM to_tsquery('simple', :query) query
+        """), params).first()
+        if not nodes:
+            return self._search_like(tokens, limit, offset)
+        return total, []
+
+    def _search_sqlite(self, tokens, limit, offset):
+        params = {'query': ' '.join(f'"{token}"*' for token in tokens)}
+        rows = self.db.session.execute(text(f"""
+            SELECT id, count(*) OVER ()
+            FROM (SELECT rowid AS id, bm25({FTS_TABLE}, 2.0, 1.0) AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query)
+            ORDER BY score, id
+            LIMIT :limit OFFSET :offset
+        """), dict(params, limit=limit, offset=offset)).fetchall()
+        if rows:
+            return self._load(rows)
+        if not offset:
+            return 0, []
+        # past the last match, so the window count came back with no row
+        total = self.db.session.execute(text(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query"),
+                                        params).scalar()
+        return total, []
+
+    def _search_like(self, tokens, limit, offset):
+        model = self.model
+        query = model.query
+        for token in tokens:
+            pattern = f'%{token}%'
+            query = query.filter(model.question.ilike(pattern) | model.answer.ilike(pattern))
+        return query.count(), query.order_by(model.id).limit(limit).offset(offset).all()
+
+    def _load(self, rows):
+        """The questions of non-empty ``(id, total)`` rows, in row order, and the total."""
+        ids = [row[0] for row in rows]
+        questions = {question.id: question for question in self.model.query.filter(self.model.id.in_(ids))}
+        return rows[0][1], [questions[question_id] for question_id in ids if question_id in questions]
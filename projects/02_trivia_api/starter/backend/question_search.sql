@@ -0,0 +1,26 @@
+--
+-- Full-text search over questions and answers (see flaskr/search.py).
+-- Apply after trivia.psql:  psql trivia < question_search.sql
+-- The 'simple' configuration keeps every word; 'english' would drop stop words.
+--
+
+ALTER TABLE public.questions ADD COLUMN search_vector tsvector;
+
+CREATE FUNCTION public.questions_search_vector_update() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.question, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.answer, '')), 'B');
+    RETURN NEW;
+END
+$$;
+
+CREATE TRIGGER questions_search_vector_update BEFORE INSERT OR UPDATE OF question, answer ON public.questions
+    FOR EACH ROW EXECUTE PROCEDURE public.questions_search_vector_update();
+
+-- fills search_vector of the existing rows through the trigger
+UPDATE public.questions SET question = question;
+
+CREATE INDEX questions_search_vector_idx ON public.questions USING gin (search_vector);
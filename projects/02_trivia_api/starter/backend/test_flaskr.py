@@ -3,8 +3,9 @@ import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 
-from flaskr import create_app
+from flaskr import create_app, category_cache, question_counts, question_pool, question_search
 from models import setup_db, Question, Category
+from query_stats import query_budget
 import json
 import pprint
 
@@ -26,6 +27,11 @@ class TriviaTestCase(unittest.TestCase):
             self.db.init_app(self.app)
             # create all tables
             self.db.create_all()
+
+        # the caches are per process, so every test starts cold
+        question_counts.invalidate()
+        category_cache.invalidate()
+        question_pool.invalidate()
     
     def tearDown(self):
         """Executed after reach test"""
@@ -41,10 +47,43 @@ class TriviaTestCase(unittest.TestCase):
         expected_res = {'categories': {'1': 'Science', '2': 'Art', '3': 'Geography', '4': 'History', '5': 'Entertainment', '6': 'Sports'}}
         self.assertEqual(json.loads(res.data), expected_res)
 
+    def test_get_categories_not_modified(self):
+        client = self.client()
+        etag = client.get('/categories').headers['ETag']
+        res = client.get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+    def test_get_questions_of_unknown_category(self):
+        res = self.client().get('/categories/1000/questions')
+        self.assertEqual(res.status_code, 404)
+
     def test_get_questions(self):
         res = self.client().get('/questions?page=1')
         self.assertEqual(res.status_code, 200)
 
+    def test_get_questions_query_budget(self):
+        client = self.client()
+        # cold: the questions, their count and the category map
+        with query_budget(3):
+            res = client.get('/questions?page=1')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('db;dur=', res.headers['Server-Timing'])
+        # warm: the count and the category map are cached
+        with query_budget(1):
+            res = client.get('/questions?page=2')
+        self.assertEqual(res.status_code, 200)
+
+    def test_get_questions_after(self):
+        client = self.client()
+        first_page = json.loads(client.get('/questions?page=1').data)
+        last_id = first_page['questions'][-1]['id']
+        res = client.get(f'/questions?after={last_id}')
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], first_page['total_questions'])
+        second_page = json.loads(client.get('/questions?page=2').data)
+        self.assertEqual(data['questions'], second_page['questions'])
+
     def test_get_questions_not_exists_page(self):
         res = self.client().get('/questions?page=100')
         self.assertEqual(res.status_code, 404)
@@ -60,6 +99,83 @@ class TriviaTestCase(unittest.TestCase):
         res = client.delete(f'/questions/{question.id}')
         self.assertEqual(res.status_code, 200)
 
+    def test_create_question_return_representation(self):
+        client = self.client()
+        res = client.post('/questions', json={'question': 'Prefer?', 'answer': 'Yes', 'category': 1, 'difficulty': 1},
+                          headers={'Prefer': 'return=representation'})
+        self.assertEqual(res.status_code, 201)
+        question = json.loads(res.data)['question']
+        self.assertEqual(question['question'], 'Prefer?')
+        self.assertEqual(json.loads(client.get(res.headers['Location']).data)['question'], question)
+        client.delete(f"/questions/{question['id']}")
+
+    def test_create_question_return_minimal(self):
+        client = self.client()
+        res = client.post('/questions', json={'question': 'Minimal?', 'answer': 'Yes', 'category': 1, 'difficulty': 1},
+                          headers={'Prefer': 'return=minimal'})
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.data, b'')
+        question_id = int(res.headers['Location'].rsplit('/', 1)[1])
+        client.delete(f'/questions/{question_id}')
+
+    def test_bulk_import_and_export(self):
+        client = self.client()
+        body = '\n'.join([
+            json.dumps({'question': 'Bulk question?', 'answer': 'Bulk answer', 'category': 1, 'difficulty': 2}),
+            json.dumps({'question': 'Bulk question?', 'answer': 'Bulk answer', 'category': 1000, 'difficulty': 2}),
+        ])
+        res = client.post('/questions/bulk', data=body, content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertEqual((data['inserted'], data['rejected']), (1, 1))
+        self.assertEqual(data['errors'][0]['line'], 2)
+
+        res = client.get('/questions/export')
+        self.assertEqual(res.status_code, 200)
+        exported = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+        bulk = [q for q in exported if q['question'] == 'Bulk question?']
+        self.assertEqual(len(bulk), 1)
+        client.delete(f"/questions/{bulk[0]['id']}")
+
+    def test_bulk_import_rejects_non_integers(self):
+        body = '\n'.join([
+            json.dumps({'question': 'Bulk question?', 'answer': 'a', 'category': 1, 'difficulty': 2.9}),
+            json.dumps({'question': 'Bulk question?', 'answer': 'a', 'category': True, 'difficulty': 2}),
+        ])
+        res = self.client().post('/questions/bulk', data=body, content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertEqual((data['inserted'], data['rejected']), (0, 2))
+        self.assertEqual(data['errors'], [
+            {'line': 1, 'message': 'difficulty must be an integer'},
+            {'line': 2, 'message': 'category must be an integer'},
+        ])
+
+    def test_bulk_import_invalid_utf8(self):
+        body = json.dumps({'question': 'Bulk question?', 'answer': 'a', 'category': 1, 'difficulty': 2}).encode() + b'\n\xff\n'
+        res = self.client().post('/questions/bulk', data=body, content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 400)
+        data = json.loads(res.data)
+        self.assertEqual((data['inserted'], data['rejected']), (0, 0))
+
+    def test_delete_questions(self):
+        client = self.client()
+        ids = []
+        for i in range(3):
+            res = client.post('/questions', json={'question': f'Batch {i}?', 'answer': 'a', 'category': 1, 'difficulty': 1},
+                              headers={'Prefer': 'return=representation'})
+            ids.append(json.loads(res.data)['question']['id'])
+        res = client.delete('/questions', json={'ids': ids + [100000]})
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertEqual(data['deleted'], 3)
+        self.assertEqual(data['missing'], [100000])
+        self.assertEqual(client.get(f'/questions/{ids[0]}').status_code, 404)
+
+    def test_delete_questions_without_filter(self):
+        res = self.client().delete('/questions', json={})
+        self.assertEqual(res.status_code, 400)
+
     def test_delete_invalid_question(self):
         res = self.client().delete('/questions/0')
         self.assertEqual(res.status_code, 400)
@@ -68,9 +184,26 @@ class TriviaTestCase(unittest.TestCase):
         term = 'What'
         res = self.client().post('/questions', json={'searchTerm': term})
         self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], 8)
+        for question in data['questions']:
+            text = (question['question'] + ' ' + question['answer']).lower()
+            assert term.lower() in text
+
+    def test_search_question_not_exists_page(self):
+        for page in (0, 100):
+            res = self.client().post('/questions', json={'searchTerm': 'What', 'page': page})
+            self.assertEqual(res.status_code, 404)
+
+    def test_search_question_total_past_last_page(self):
+        with self.app.app_context():
+            self.assertEqual(question_search.search('What', page=100), (8, []))
+
+    def test_search_question_by_answer_prefix(self):
+        res = self.client().post('/questions', json={'searchTerm': 'scissor'})
+        self.assertEqual(res.status_code, 200)
         questions = json.loads(res.data)['questions']
-        for question in questions:
-            assert term in question['question']
+        self.assertEqual([q['answer'] for q in questions], ['Edward Scissorhands'])
 
     def test_get_questions_by_category(self):
         category = 5
@@ -80,6 +213,52 @@ class TriviaTestCase(unittest.TestCase):
         for q in questions:
             self.assertEqual(q['category'], category)
 
+    def test_quiz_pool_follows_writes(self):
+        client = self.client()
+        with self.app.app_context():
+            question_pool.category_ids(1)
+            loaded_at = question_pool._loaded_at
+            res = client.post('/questions', json={'question': 'Pooled?', 'answer': 'Yes', 'category': 1, 'difficulty': 1},
+                              headers={'Prefer': 'return=representation'})
+            question_id = json.loads(res.data)['question']['id']
+            self.assertIn(question_id, question_pool.category_ids(1))
+            client.delete(f'/questions/{question_id}')
+            self.assertNotIn(question_id, question_pool.category_ids(1))
+            self.assertNotIn(question_id, question_pool.category_ids())
+            # applied to the pool, not rebuilt
+            self.assertEqual(question_pool._loaded_at, loaded_at)
+
+    def test_quiz_skips_previous_questions(self):
+        client = self.client()
+        questions = json.loads(client.get('/categories/5/questions').data)['questions']
+        ids = [q['id'] for q in questions]
+        res = client.post('/quizzes', json={'previous_questions': ids[:-1], 'quiz_category': {'id': 5}})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['question']['id'], ids[-1])
+
+        res = client.post('/quizzes', json={'previous_questions': ids, 'quiz_category': {'id': 5}})
+        self.assertIsNone(json.loads(res.data)['question'])
+
+    def test_quiz_session(self):
+        client = self.client()
+        res = client.post('/quizzes/sessions', json={'quiz_category': {'id': 5}})
+        self.assertEqual(res.status_code, 201)
+        session_id = json.loads(res.data)['session_id']
+
+        num_questions = json.loads(client.get('/categories/5/questions').data)['total_questions']
+        asked = []
+        for _ in range(num_questions):
+            question = json.loads(client.post('/quizzes', json={'session_id': session_id}).data)['question']
+            self.assertEqual(question['category'], 5)
+            asked.append(question['id'])
+        self.assertEqual(len(set(asked)), num_questions)
+        res = client.post('/quizzes', json={'session_id': session_id})
+        self.assertIsNone(json.loads(res.data)['question'])
+
+    def test_quiz_unknown_session(self):
+        res = self.client().post('/quizzes', json={'session_id': 'unknown'})
+        self.assertEqual(res.status_code, 404)
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+"""Benchmarks for the coffee shop API.
+
+Everything runs against a throwaway SQLite database in a temporary directory
+and tokens signed with a key generated on the spot, so nothing here touches
+database.db or Auth0:
+
+    $ python benchmark.py auth --requests 2000 --tokens 1 50
+    $ python benchmark.py menu --requests 2000 --drinks 20 200
+    $ python benchmark.py concurrency --readers 8 --writers 2 --seconds 5
+    $ python benchmark.py permissions --scopes 10 100 500
+
+The database settings of models.py are read from the environment, so the
+concurrency benchmark can be run with SQLite's defaults for comparison:
+
+    $ SQLITE_JOURNAL_MODE=DELETE SQLITE_SYNCHRONOUS=FULL DB_READ_POOL_SIZE=0 \
+      DB_WRITE_POOL_SIZE=0 DB_SPLIT_READS=0 python benchmark.py concurrency
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+import timeit
+
+database_directory = tempfile.TemporaryDirectory()
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(database_directory.name, "benchmark.db")}')
+
+from Crypto.PublicKey import RSA
+from jose import jwt
+
+from src.api import app, menu
+from src.auth import auth
+from src.auth.jwks import JWKSKeyStore, static_provider
+from src.auth.auth import AllOf, AnyOf, TokenPayload
+from src.auth.token_cache import VerifiedTokenCache
+from src.database.models import db, db_drop_and_create_all, Drink
+
+KID = 'benchmark'
+
+
+def b64_int(value):
+    return base64.urlsafe_b64encode(value.to_bytes((value.bit_length() + 7) // 8, 'big')).rstrip(b'=').decode()
+
+
+def signing_key():
+    """A fresh RSA key, and a key store serving its public half in place of Auth0's."""
+    key = RSA.generate(2048)
+    jwks = {'keys': [{'kty': 'RSA', 'kid': KID, 'use': 'sig', 'n': b64_int(key.n), 'e': b64_int(key.e)}]}
+    return key.export_key().decode(), JWKSKeyStore(static_provider(jwks))
+
+
+def make_token(private_key, subject, permissions):
+    return jwt.encode({
+        'iss': f'https://{auth.AUTH0_DOMAIN}/',
+        'aud': auth.API_AUDIENCE,
+        'sub': subject,
+        'exp': int(time.time()) + 3600,
+        'permissions': permissions,
+    }, private_key, algorithm='RS256', headers={'kid': KID})
+
+
+def seed_drinks(num_drinks):
+    db_drop_and_create_all()
+    for i in range(num_drinks):
+        db.session.add(Drink(title=f'Drink {i}', recipe=json.dumps([
+            {'name': 'espresso', 'color': 'brown', 'parts': 1},
+            {'name': 'milk', 'color': 'white', 'parts': i % 3 + 1},
+        ])))
+    db.session.commit()
+
+
+def bench_auth(requests=2000, tokens=(1, 50), drinks=20):
+    """Throughput of /drinks-detail with every token verified, and with the verified-token cache."""
+    private_key, auth.jwks = signing_key()
+    client = app.test_client()
+    seed_drinks(drinks)
+    print(f'{"tokens":>7} {"verification":>13} {"requests/s":>11} {"ms/request":>11} {"hit rate":>9}')
+    for num_tokens in tokens:
+        headers = [{'Authorization': f'Bearer {make_token(private_key, f"user-{i}", ["get:drinks-detail"])}'}
+                   for i in range(num_tokens)]
+        for label, cache in (('every request', VerifiedTokenCache(max_tokens=0)), ('cached', VerifiedTokenCache())):
+            auth.verified_tokens = cache
+            start = time.perf_counter()
+            for i in range(requests):
+                response = client.get('/drinks-detail', headers=headers[i % num_tokens])
+                assert response.status_code == 200, response.get_json()
+            elapsed = time.perf_counter() - start
+            print(f'{num_tokens:>7} {label:>13} {requests / elapsed:>11.0f} {elapsed / requests * 1000:>11.2f} '
+                  f'{cache.stats()["hit_rate"]:>9.1%}')
+
+
+def bench_menu(requests=2000, drinks=(20, 200)):
+    """Throughput of /drinks rebuilt on every request, served from the menu cache, and revalidated with its ETag."""
+    client = app.test_client()
+    print(f'{"drinks":>7} {"menu":>12} {"requests/s":>11} {"ms/request":>11}')
+    for num_drinks in drinks:
+        seed_drinks(num_drinks)
+        etag = client.get('/drinks').headers['ETag']
+        cases = [
+            ('rebuilt', menu.invalidate, {}),
+            ('cached', lambda: None, {}),
+            ('revalidated', lambda: None, {'If-None-Match': etag}),
+        ]
+        for label, before, headers in cases:
+            start = time.perf_counter()
+            for _ in range(requests):
+                before()
+                client.get('/drinks', headers=headers)
+            elapsed = time.perf_counter() - start
+            print(f'{num_drinks:>7} {label:>12} {requests / elapsed:>11.0f} {elapsed / requests * 1000:>11.2f}')
+
+
+def bench_concurrency(readers=8, writers=2, seconds=5, drinks=20):
+    """Throughput and latency of ``readers`` threads on /drinks alongside ``writers`` threads on PATCH /drinks/<id>."""
+    private_key, auth.jwks = signing_key()
+    seed_drinks(drinks)
+    # writes queued behind each other would log every one as a slow query
+    logging.getLogger('query_stats').setLevel(logging.ERROR)
+    headers = {'Authorization': f'Bearer {make_token(private_key, "manager", ["patch:drinks"])}'}
+    deadline = time.perf_counter() + seconds
+    results = {'read': [], 'write': []}
+    failures = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+
+    def run(kind, worker):
+        client = app.test_client()
+        timings = []
+        failed = 0
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            start = time.perf_counter()
+            if kind == 'read':
+                response = client.get('/drinks')
+            else:
+                response = client.patch(f'/drinks/{(worker + i * writers) % drinks + 1}', headers=headers, json={
+                    'recipe': [{'name': 'espresso', 'color': 'brown', 'parts': i % 5 + 1}]})
+            timings.append((time.perf_counter() - start) * 1000)
+            failed += response.status_code != 200
+        with lock:
+            results[kind].extend(timings)
+            failures[kind] += failed
+
+    threads = [threading.Thread(target=run, args=('read', n)) for n in range(readers)] + \
+              [threading.Thread(target=run, args=('write', n)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    config = app.config
+    print(f'journal_mode={config["SQLITE_JOURNAL_MODE"]} synchronous={config["SQLITE_SYNCHRONOUS"]} '
+          f'read pool={config["DB_READ_POOL_SIZE"]} write pool={config["DB_WRITE_POOL_SIZE"]} '
+          f'split reads={config["DB_SPLIT_READS"]}')
+    print(f'{"requests":>9} {"threads":>8} {"per second":>11} {"failed":>7} {"median ms":>10} {"p95 ms":>8}')
+    for kind, threads_of_kind in (('read', readers), ('write', writers)):
+        timings = sorted(results[kind])
+        if not timings:
+            continue
+        print(f'{kind:>9} {threads_of_kind:>8} {len(timings) / seconds:>11.0f} {failures[kind]:>7} '
+              f'{statistics.median(timings):>10.1f} {timings[int(len(timings) * 0.95)]:>8.1f}')
+
+
+def bench_permissions(scopes=(10, 100, 500), repeat=20000):
+    """Microseconds per permission check: scanning the token's permissions list, against a compiled expression."""
+    print(f'{"scopes":>7} {"required":>16} {"list scan":>10} {"compiled":>9}')
+    for num_scopes in scopes:
+        granted = [f'scope:{i}' for i in range(num_scopes)]
+        payload = TokenPayload({'permissions': granted})
+        # the worst case for a scan: permissions at the end of the list, or missing
+        last = granted[-3:]
+        missing = ['missing:1', 'missing:2', 'missing:3']
+        cases = [
+            ('1 permission', lambda: last[-1] in payload['permissions'], AllOf(last[-1])),
+            ('all of 3', lambda: all(p in payload['permissions'] for p in last), AllOf(*last)),
+            ('any of 3, none', lambda: any(p in payload['permissions'] for p in missing), AnyOf(*missing)),
+        ]
+        for label, scan, expression in cases:
+            scanned = timeit.timeit(scan, number=repeat)
+            compiled = timeit.timeit(lambda: expression.allows(payload.permission_set), number=repeat)
+            print(f'{num_scopes:>7} {label:>16} {scanned / repeat * 1e6:>10.2f} {compiled / repeat * 1e6:>9.2f}')
+
+
+BENCHMARKS = {
+    'auth': bench_auth,
+    'menu': bench_menu,
+    'concurrency': bench_concurrency,
+    'permissions': bench_permissions,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--tokens', type=int, nargs='+', default=[1, 50],
+                        help='Distinct bearer tokens the requests cycle through, for the auth benchmark.')
+    parser.add_argument('--drinks', type=int, nargs='+', default=[20, 200], help='Menu sizes, for the menu benchmark.')
+    parser.add_argument('--readers', type=int, default=8, help='Threads reading /drinks, for the concurrency benchmark.')
+    parser.add_argument('--writers', type=int, default=2, help='Threads patching drinks, for the concurrency benchmark.')
+    parser.add_argument('--seconds', type=float, default=5, help='Duration of the concurrency benchmark.')
+    parser.add_argument('--scopes', type=int, nargs='+', default=[10, 100, 500],
+                        help='Permissions carried by the token, for the permissions benchmark.')
+    args = parser.parse_args()
+    if args.benchmark == 'concurrency':
+        bench_concurrency(readers=args.readers, writers=args.writers, seconds=args.seconds)
+    elif args.benchmark == 'permissions':
+        bench_permissions(scopes=args.scopes)
+    else:
+        options = {'tokens': args.tokens} if args.benchmark == 'auth' else {'drinks': args.drinks}
+        BENCHMARKS[args.benchmark](requests=args.requests, **options)
@@ -1,15 +1,20 @@
 import os
 from flask import Flask, request, jsonify, abort
 from sqlalchemy import exc
+from sqlalchemy.orm.exc import StaleDataError
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db, db_drop_and_create_all, add_drink_versions, migrate_recipes, setup_db, Drink, Ingredient
 from .auth.auth import AuthError, requires_auth
+from .menu import MenuCache
+from .query_stats import QueryStats
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
+QueryStats(app)
+menu = MenuCache(Drink, Ingredient)
 
 '''
 @TODO uncomment the following line to initialize the datbase
@@ -18,7 +23,23 @@ CORS(app)
 '''
 # db_drop_and_create_all()
 
+
+## COMMANDS
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Brings a database created by an earlier version of the models up to date."""
+    print(f'Migrated the recipes of {migrate_recipes()} drinks.')
+    if add_drink_versions():
+        print('Added drink versions.')
+
+
 ## ROUTES
+def menu_response(form):
+    body, etag = menu.get(form)
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
 '''
 @TODO implement endpoint
     GET /drinks
@@ -27,6 +48,10 @@ CORS(app)
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks')
+@QueryStats.budget(2)
+def get_drinks():
+    return menu_response('short')
 
 
 '''
@@ -37,6 +62,11 @@ CORS(app)
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks-detail')
+@QueryStats.budget(2)
+@requires_auth('get:drinks-detail')
+def get_drinks_detail(payload):
+    return menu_response('long')
 
 
 '''
@@ -61,6 +91,48 @@ CORS(app)
     returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the updated drink
         or appropriate status code indicating reason for failure
 '''
+# tries of a PATCH without If-Match that keeps losing the race with other updates, before a 409
+PATCH_ATTEMPTS = 3
+
+
+@app.route('/drinks/<int:drink_id>', methods=['PATCH'])
+@requires_auth('patch:drinks')
+def update_drink(payload, drink_id):
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(422)
+    if 'title' in body and not (isinstance(body['title'], str) and body['title'].strip()):
+        abort(422)
+    conditional = 'If-Match' in request.headers
+    for attempt in range(PATCH_ATTEMPTS):
+        drink = Drink.query.get(drink_id)
+        if drink is None:
+            abort(404)
+        if conditional and not request.if_match.contains(drink.etag):
+            abort(412)
+        try:
+            if 'title' in body:
+                drink.title = body['title']
+            if 'recipe' in body:
+                drink.recipe = body['recipe']
+            # only updates the version it read, see Drink.version
+            drink.update()
+            break
+        except StaleDataError:
+            db.session.rollback()
+            if conditional:
+                abort(412)
+        except (ValueError, exc.IntegrityError):
+            db.session.rollback()
+            abort(422)
+    else:
+        abort(409)
+    response = jsonify({
+        'success': True,
+        'drinks': [drink.long()]
+    })
+    response.set_etag(drink.etag)
+    return response
 
 
 '''
@@ -102,9 +174,41 @@ def unprocessable(error):
 @TODO implement error handler for 404
     error handler should conform to general task above 
 '''
+@app.errorhandler(404)
+def not_found(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 404,
+                    "message": "resource not found"
+                    }), 404
+
+
+@app.errorhandler(409)
+def conflict(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 409,
+                    "message": "conflicting update, try again"
+                    }), 409
+
+
+@app.errorhandler(412)
+def precondition_failed(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 412,
+                    "message": "drink changed since it was read"
+                    }), 412
 
 
 '''
 @TODO implement error handler for AuthError
     error handler should conform to general task above 
 '''
+@app.errorhandler(AuthError)
+def auth_error(error):
+    return jsonify({
+                    "success": False, 
+                    "error": error.status_code,
+                    "message": error.error['description']
+                    }), error.status_code
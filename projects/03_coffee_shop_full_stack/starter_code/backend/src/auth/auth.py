@@ -1,14 +1,23 @@
 import json
+import os
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import JWKSKeyStore, JWKSUnavailable, file_provider, url_provider
+from .token_cache import ReadOnlyPayload, VerifiedTokenCache
 
 
 AUTH0_DOMAIN = 'udacity-fsnd.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'dev'
 
+# JWKS_FILE points at a local copy of the key set, to run offline
+jwks = JWKSKeyStore(file_provider(os.environ['JWKS_FILE']) if os.environ.get('JWKS_FILE')
+                    else url_provider(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'))
+# payloads of tokens already verified, see token_cache.py; verified_tokens.stats() has the hit rate
+verified_tokens = VerifiedTokenCache()
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -20,6 +29,75 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+## Permissions
+'''
+AllOf, AnyOf
+    permission expressions for requires_auth, met by a token with all, or any, of the permissions
+    the permissions can themselves be expressions
+    EXAMPLE
+        @requires_auth(AnyOf('patch:drinks', 'post:drinks'))
+        @requires_auth(AllOf('get:drinks-detail', AnyOf('patch:drinks', 'post:drinks')))
+'''
+class PermissionExpression(frozenset):
+    def __new__(cls, *permissions):
+        return super().__new__(cls, permissions)
+
+    def __init__(self, *permissions):
+        # permission strings are checked with one set operation, nested expressions one at a time
+        self.nested = tuple(p for p in permissions if isinstance(p, PermissionExpression))
+        self.permissions = self.difference(self.nested) if self.nested else frozenset(self)
+
+    # AllOf('a', 'b') and AnyOf('a', 'b') differ, though they hold the same permissions
+    def __eq__(self, other):
+        return type(self) is type(other) and frozenset.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((type(self), frozenset(self)))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(map(repr, sorted(self, key=repr)))})"
+
+
+class AllOf(PermissionExpression):
+    def allows(self, permissions):
+        return self.permissions <= permissions and (
+            not self.nested or all(expression.allows(permissions) for expression in self.nested))
+
+
+class AnyOf(PermissionExpression):
+    def allows(self, permissions):
+        return not self.permissions.isdisjoint(permissions) or (
+            bool(self.nested) and any(expression.allows(permissions) for expression in self.nested))
+
+
+'''
+compile_permission(permission)
+    the expression for a permission string, an AllOf or an AnyOf, or a list of permissions all required
+    an empty permission is met by any token carrying permissions
+'''
+def compile_permission(permission):
+    if isinstance(permission, PermissionExpression):
+        return permission
+    if isinstance(permission, str):
+        return AllOf(permission) if permission else AllOf()
+    return AllOf(*permission)
+
+
+'''
+TokenPayload
+    the claims of a verified token, as a read-only dict, see token_cache.py
+    permission_set holds its permissions as a frozenset, built once per token as the payload
+    is kept by verified_tokens, so checking an expression costs one set operation
+'''
+class TokenPayload(ReadOnlyPayload):
+    def __init__(self, claims):
+        super().__init__(claims)
+        self.permission_set = frozenset(claims.get('permissions') or ())
+
+
 ## Auth Header
 
 '''
@@ -31,12 +109,39 @@ class AuthError(Exception):
     return the token part of the header
 '''
 def get_token_auth_header():
-   raise Exception('Not Implemented')
+    auth = request.headers.get('Authorization', None)
+    # a header of whitespace only counts as missing
+    parts = auth.split() if auth else []
+    if not parts:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+
+    if parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    return parts[1]
 
 '''
 @TODO implement check_permissions(permission, payload) method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink'), or an expression, see compile_permission()
         payload: decoded jwt payload
 
     it should raise an AuthError if permissions are not included in the payload
@@ -45,7 +150,19 @@ def get_token_auth_header():
     return true otherwise
 '''
 def check_permissions(permission, payload):
-    raise Exception('Not Implemented')
+    if 'permissions' not in payload:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Permissions not included in JWT.'
+        }, 400)
+
+    permissions = payload.permission_set if isinstance(payload, TokenPayload) else frozenset(payload['permissions'])
+    if not compile_permission(permission).allows(permissions):
+        raise AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)
+    return True
 
 '''
 @TODO implement verify_decode_jwt(token) method
@@ -54,6 +171,7 @@ def check_permissions(permission, payload):
 
     it should be an Auth0 token with key id (kid)
     it should verify the token using Auth0 /.well-known/jwks.json
+        keys come from the cached key store in jwks.py, not a fetch per request
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
@@ -61,25 +179,78 @@ def check_permissions(permission, payload):
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    raise Exception('Not Implemented')
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401)
+    if 'kid' not in unverified_header:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization malformed.'
+        }, 401)
+
+    try:
+        rsa_key = jwks.get_key(unverified_header['kid'])
+    except JWKSUnavailable:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the keys to verify the token.'
+        }, 503)
+    if not rsa_key:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to find the appropriate key.'
+        }, 400)
+
+    try:
+        return TokenPayload(jwt.decode(
+            token,
+            rsa_key,
+            algorithms=ALGORITHMS,
+            audience=API_AUDIENCE,
+            issuer='https://' + AUTH0_DOMAIN + '/'
+        ))
+
+    except jwt.ExpiredSignatureError:
+        raise AuthError({
+            'code': 'token_expired',
+            'description': 'Token expired.'
+        }, 401)
+
+    except jwt.JWTClaimsError:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Incorrect claims. Please, check the audience and issuer.'
+        }, 401)
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
 
 '''
 @TODO implement @requires_auth(permission) decorator method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink'), or an expression, compiled once here
 
     it should use the get_token_auth_header method to get the token
     it should use the verify_decode_jwt method to decode the jwt
+        tokens already verified are served from verified_tokens until they expire
     it should use the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
 '''
 def requires_auth(permission=''):
+    required = compile_permission(permission)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            payload = verified_tokens.verify(token, verify_decode_jwt)
+            check_permissions(required, payload)
             return f(payload, *args, **kwargs)
 
         return wrapper
@@ -0,0 +1,137 @@
+"""Cached JSON Web Key Set (JWKS) lookups for verifying tokens.
+
+Fetching https://<domain>/.well-known/jwks.json on every request costs a network
+round-trip per API call. ``JWKSKeyStore`` keeps the keys by ``kid`` instead:
+
+- keys are fetched on first use and kept for ``ttl`` seconds;
+- once they are older than ``refresh_after`` seconds, a lookup starts a refresh
+  in a background thread and carries on with the keys it has, so requests only
+  wait on the network when the keys have expired;
+- an unknown ``kid`` (e.g. after the issuer rotated its keys) triggers a
+  refetch, at most once every ``min_refetch_interval`` seconds, so tokens with
+  made-up kids cannot make the server hammer the issuer;
+- when a refresh fails, the keys already fetched keep being used, expired or
+  not, and the next attempt waits ``min_refetch_interval`` seconds too;
+- with no keys at all, a lookup raises ``JWKSUnavailable`` rather than answer
+  that the kid is unknown, which would reject a valid token as invalid.
+
+Deciding to refetch and recording the attempt happen under one lock, so
+concurrent lookups start a single fetch; the others wait for it.
+
+Keys come from a provider, any callable returning the JWKS document: the
+issuer's URL, a local file or a fixed document, which keeps tests offline.
+
+BasicFlaskAuth/jwks.py is a copy of this module, which
+check_shared_modules.py at the repository root keeps in step with it.
+"""
+import json
+import threading
+import time
+from urllib.request import urlopen
+
+
+class JWKSUnavailable(Exception):
+    """No keys could be fetched and none are cached."""
+
+
+def url_provider(url, timeout=5):
+    def fetch():
+        with urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+    return fetch
+
+
+def file_provider(path):
+    def fetch():
+        with open(path) as f:
+            return json.load(f)
+    return fetch
+
+
+def static_provider(jwks):
+    return lambda: jwks
+
+
+class JWKSKeyStore:
+
+    def __init__(self, provider, ttl=3600, refresh_after=None, min_refetch_interval=30,
+                 clock=time.monotonic, background=True):
+        self.provider = provider
+        self.ttl = ttl
+        self.refresh_after = refresh_after if refresh_after is not None else ttl * 0.8
+        self.min_refetch_interval = min_refetch_interval
+        self.clock = clock
+        self.background = background
+        self.lock = threading.Lock()
+        # held while fetching, so that lookups can wait for a fetch in flight
+        self.fetch_lock = threading.Lock()
+        self.keys = {}
+        self.fetched_at = None
+        self.attempted_at = None
+        self._refreshing = False
+
+    def get_key(self, kid):
+        """The key with this ``kid``, or None if the issuer does not have it."""
+        now = self.clock()
+        with self.lock:
+            key = self.keys.get(kid)
+            age = now - self.fetched_at if self.fetched_at is not None else None
+            if key is not None and age < self.ttl:
+                if age >= self.refresh_after and self.background and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, daemon=True).start()
+                return key
+            # expired, never fetched or an unknown kid
+            claimed = self._claim_refetch(now)
+        if claimed:
+            self._fetch()
+        else:
+            # rate limited: wait for the fetch in flight, if any, then answer with what there is
+            with self.fetch_lock:
+                pass
+        with self.lock:
+            if not self.keys:
+                raise JWKSUnavailable('no keys fetched yet')
+            return self.keys.get(kid)
+
+    def refresh(self):
+        """Fetches the keys now; on failure keeps the current ones, if any."""
+        with self.lock:
+            self.attempted_at = self.clock()
+        self._fetch()
+
+    def _claim_refetch(self, now):
+        """Records an attempt at ``now`` and returns True, unless the last one is too recent; call with the lock held."""
+        if self.attempted_at is not None and now - self.attempted_at < self.min_refetch_interval:
+            return False
+        self.attempted_at = now
+        return True
+
+    def _fetch(self):
+        with self.fetch_lock:
+            try:
+                jwks = self.provider()
+                keys = {key['kid']: {
+                    'kty': key['kty'],
+                    'kid': key['kid'],
+                    'use': key.get('use'),
+                    'n': key['n'],
+                    'e': key['e'],
+                } for key in jwks['keys'] if 'kid' in key and key.get('kty') == 'RSA'}
+            except Exception as e:
+                with self.lock:
+                    if not self.keys:
+                        raise JWKSUnavailable(str(e)) from e
+                return
+            with self.lock:
+                self.keys = keys
+                self.fetched_at = self.clock()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except JWKSUnavailable:
+            pass
+        finally:
+            with self.lock:
+                self._refreshing = False
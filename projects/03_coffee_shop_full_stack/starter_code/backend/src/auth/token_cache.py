@@ -0,0 +1,101 @@
+"""Cache of verified token payloads.
+
+Checking an RS256 signature costs far more than the rest of a request to a
+small API, and clients send the same bearer token on every request until it
+expires. ``VerifiedTokenCache`` keeps the payloads of tokens that passed
+verification until their ``exp``, so a token is verified once rather than on
+every request:
+
+- entries are keyed by the SHA-256 of the token; the tokens themselves are
+  credentials and are never kept;
+- at most ``max_tokens`` payloads are kept, the least recently used dropped
+  first; ``max_tokens=0`` turns the cache off;
+- tokens without ``exp`` are never cached.
+
+The same payload is handed to every request made with a token, so it is kept
+as a ``ReadOnlyPayload``: a dict that raises TypeError on any change, so that
+one view cannot alter the claims another request sees. The check is shallow;
+views must not modify the values either, e.g. the permissions list.
+
+BasicFlaskAuth/token_cache.py is a copy of this module, which
+check_shared_modules.py at the repository root keeps in step with it.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class ReadOnlyPayload(dict):
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('token payloads are shared between requests and cannot be modified')
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # copy and pickle rebuild the dict through the constructor rather than item by item
+        return type(self), (dict(self),)
+
+
+class VerifiedTokenCache:
+
+    def __init__(self, max_tokens=1024, clock=time.time):
+        self.max_tokens = max_tokens
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.payloads = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, token, verify):
+        """The payload of ``token``, from the cache or else from ``verify(token)``, which raises if it is invalid."""
+        payload = self.get(token)
+        if payload is None:
+            payload = verify(token)
+            if not isinstance(payload, ReadOnlyPayload):
+                payload = ReadOnlyPayload(payload)
+            self.set(token, payload)
+        return payload
+
+    def get(self, token):
+        key = self._key(token)
+        with self.lock:
+            payload = self.payloads.get(key)
+            if payload is not None and payload['exp'] > self.clock():
+                self.payloads.move_to_end(key)
+                self.hits += 1
+                return payload
+            if payload is not None:
+                del self.payloads[key]
+            self.misses += 1
+            return None
+
+    def set(self, token, payload):
+        if not self.max_tokens or not isinstance(payload.get('exp'), (int, float)):
+            return
+        key = self._key(token)
+        with self.lock:
+            self.payloads[key] = payload
+            self.payloads.move_to_end(key)
+            while len(self.payloads) > self.max_tokens:
+                self.payloads.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.payloads.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.payloads),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
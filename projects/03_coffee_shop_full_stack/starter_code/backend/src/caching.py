@@ -0,0 +1,65 @@
+"""Keeping in-process caches of table data in step with ORM writes.
+
+Copied from projects/02_trivia_api/starter/backend/flaskr/caching.py, and kept
+in step with it by check_shared_modules.py at the repository root.
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+PENDING_INVALIDATIONS = 'cache_invalidations'
+PENDING_CHANGES = 'cache_changes'
+
+
+def invalidate_on_write(model, cache):
+    """Calls ``cache.invalidate()`` whenever rows of ``model`` are inserted, updated or deleted.
+
+    Caches are invalidated when the write is flushed and again when it is
+    committed: anything cached in between was read without the uncommitted
+    write. Writes that bypass the ORM (``Query.delete()``, raw SQL) are not
+    seen, so callers have to invalidate after them.
+    """
+    def on_write(mapper, connection, target):
+        cache.invalidate()
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(PENDING_INVALIDATIONS, set()).add(cache)
+
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, on_write)
+
+
+def apply_on_commit(model, cache):
+    """Calls ``cache.apply(changes)`` with the writes to rows of ``model`` once they are committed.
+
+    For caches that can be updated in place rather than dropped. As each write
+    is flushed, ``cache.change(operation, target)`` is called with
+    ``operation`` one of 'insert', 'update' or 'delete', and returns what
+    ``apply`` needs to know of it, or None to ignore it: by the time of the
+    commit the target is expired, or gone. Rolled back writes are never
+    applied. Writes that bypass the ORM are not seen, so callers have to
+    invalidate after them.
+    """
+    def on_write(operation):
+        def record(mapper, connection, target):
+            session = object_session(target)
+            change = cache.change(operation, target)
+            if session is not None and change is not None:
+                session.info.setdefault(PENDING_CHANGES, {}).setdefault(cache, []).append(change)
+        return record
+
+    for operation in ('insert', 'update', 'delete'):
+        event.listen(model, f'after_{operation}', on_write(operation))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for cache in session.info.pop(PENDING_INVALIDATIONS, ()):
+        cache.invalidate()
+    for cache, changes in session.info.pop(PENDING_CHANGES, {}).items():
+        cache.apply(changes)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop(PENDING_INVALIDATIONS, None)
+    session.info.pop(PENDING_CHANGES, None)
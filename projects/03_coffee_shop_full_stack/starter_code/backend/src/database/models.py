@@ -1,23 +1,127 @@
 import os
-from sqlalchemy import Column, String, Integer
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Column, String, Integer, ForeignKey, create_engine, event, inspect, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.sql.expression import UpdateBase
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 import json
 
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+database_path = os.environ.get('DATABASE_URL', "sqlite:///{}".format(os.path.join(project_dir, database_filename)))
+
+'''
+database settings
+    read by setup_db(app) from app.config, else from environment variables of the same name
+    they apply to SQLite database files only
+'''
+DATABASE_SETTINGS = {
+    # WAL lets readers carry on while a write is in progress
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    # NORMAL only syncs at checkpoints in WAL mode; a power loss can undo the last commits, never corrupt
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    # how long a connection waits on a lock before failing with 'database is locked'
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    # connections kept open for reads, and for writes; 0 opens a connection per request
+    'DB_READ_POOL_SIZE': 5,
+    # a single write connection queues writers in the pool rather than on SQLite's lock
+    'DB_WRITE_POOL_SIZE': 1,
+    # sends queries to the read pool, and flushes, and the rest of their transaction, to the write pool
+    'DB_SPLIT_READS': True,
+}
+
+
+'''
+RoutingSession
+    a session sending reads to app.extensions['read_engine'], when setup_db(app) created one,
+    and writes to the app's engine
+    once a transaction has written, its reads go to the write connection too, to see its own writes
+'''
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        read_engine = self.app.extensions.get('read_engine')
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+        if read_engine is None or self.info.get('wrote'):
+            return super().get_bind(mapper, clause)
+        return read_engine
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+@event.listens_for(RoutingSession, 'after_rollback')
+def _end_writes(session):
+    session.info.pop('wrote', None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
 
-db = SQLAlchemy()
+
+db = RoutingSQLAlchemy()
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    SQLite database files are configured from DATABASE_SETTINGS
+    every SQLite connection enforces foreign keys
 '''
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    for name, default in DATABASE_SETTINGS.items():
+        app.config.setdefault(name, _setting(name, default))
+    url = make_url(database_path)
+    sqlite_file = url.drivername.startswith('sqlite') and url.database not in (None, '', ':memory:')
+    if sqlite_file:
+        app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", _pool_options(app.config['DB_WRITE_POOL_SIZE']))
     db.app = app
     db.init_app(app)
+    if not url.drivername.startswith('sqlite'):
+        return
+    engines = [db.get_engine(app)]
+    # off by default in SQLite; deleting a drink relies on ON DELETE CASCADE to remove its ingredients
+    pragmas = ['PRAGMA foreign_keys=ON']
+    if sqlite_file:
+        if app.config['DB_SPLIT_READS']:
+            # relative to the app, as Flask-SQLAlchemy does for the main engine
+            url.database = os.path.join(app.root_path, url.database)
+            app.extensions['read_engine'] = create_engine(url, **_pool_options(app.config['DB_READ_POOL_SIZE']))
+            engines.append(app.extensions['read_engine'])
+        pragmas += [
+            f"PRAGMA journal_mode={app.config['SQLITE_JOURNAL_MODE']}",
+            f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}",
+            f"PRAGMA busy_timeout={int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        ]
+    for engine in engines:
+        @event.listens_for(engine, 'connect')
+        def configure_connection(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+
+def _setting(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return type(default)(value)
+
+
+def _pool_options(pool_size):
+    if not pool_size:
+        # a connection per checkout, as SQLAlchemy does for SQLite files by default
+        return {'poolclass': NullPool}
+    return {
+        'poolclass': QueuePool,
+        'pool_size': pool_size,
+        'max_overflow': 0,
+        'connect_args': {'check_same_thread': False},
+    }
 
 '''
 db_drop_and_create_all()
@@ -29,6 +133,83 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+migrate_recipes()
+    moves the recipes of a database created when they were a JSON blob in drink.recipe
+    into ingredient rows, then drops the drink.recipe column
+    returns the number of drinks migrated; does nothing once the column is gone
+    !!NOTE dropping the column needs SQLite 3.35 or later
+'''
+def migrate_recipes():
+    # creates the ingredient table, leaves drink as it is
+    db.create_all()
+    if 'recipe' not in [column['name'] for column in inspect(db.engine).get_columns('drink')]:
+        return 0
+    with db.engine.begin() as connection:
+        drinks = connection.execute(text('SELECT id, recipe FROM drink')).fetchall()
+        ingredients = [dict(ingredient, drink_id=drink_id, position=position)
+                       for drink_id, recipe in drinks
+                       for position, ingredient in enumerate(parse_recipe(recipe))]
+        if ingredients:
+            connection.execute(Ingredient.__table__.insert(), ingredients)
+        connection.execute(text('ALTER TABLE drink DROP COLUMN recipe'))
+    return len(drinks)
+
+'''
+add_drink_versions()
+    adds the drink.version column to a database created before it existed, starting every drink at version 1
+    returns True if the column was added
+'''
+def add_drink_versions():
+    if 'version' in [column['name'] for column in inspect(db.engine).get_columns('drink')]:
+        return False
+    with db.engine.begin() as connection:
+        connection.execute(text('ALTER TABLE drink ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+    return True
+
+'''
+parse_recipe(recipe)
+    the ingredients of a recipe given as a list of dicts, a single dict, or either as a JSON string
+    raises ValueError if an ingredient is missing its name, color or parts, or its parts are not a whole number
+'''
+def parse_recipe(recipe):
+    if isinstance(recipe, str):
+        recipe = json.loads(recipe)
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    try:
+        return [{'name': r['name'], 'color': r['color'], 'parts': _parts(r['parts'])} for r in recipe]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f'invalid recipe: {e}') from e
+
+
+def _parts(value):
+    try:
+        # int() alone would truncate 0.5 to 0 rather than reject it
+        if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+            raise ValueError
+        return int(value)
+    except ValueError:
+        raise ValueError(f'invalid recipe: parts must be a whole number, not {value!r}') from None
+
+'''
+Ingredient
+a part of a drink's recipe, kept in recipe order by position
+'''
+class Ingredient(db.Model):
+    id = Column(Integer, primary_key=True)
+    drink_id = Column(Integer, ForeignKey('drink.id', ondelete='CASCADE'), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    name = Column(String(80), nullable=False, index=True)
+    color = Column(String(80), nullable=False)
+    parts = Column(Integer, nullable=False)
+
+    def short(self):
+        return {'color': self.color, 'parts': self.parts}
+
+    def long(self):
+        return {'color': self.color, 'name': self.name, 'parts': self.parts}
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -38,21 +219,50 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
-    # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    # the recipe, loaded with the drink in one extra query for a whole listing
+    ingredients = relationship(Ingredient, order_by=Ingredient.position, lazy='selectin',
+                               cascade='all, delete-orphan', passive_deletes=True)
+    # incremented by update(); an update or delete of a version someone else has
+    # changed since it was read fails with sqlalchemy.orm.exc.StaleDataError
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+
+    # update() sets the version itself, as a recipe change alone only writes ingredient rows
+    __mapper_args__ = {'version_id_col': version, 'version_id_generator': False}
+
+    '''
+    etag
+        the entity tag of this version of the drink, for If-Match
+    '''
+    @property
+    def etag(self):
+        return f'{self.id}-{self.version}'
+
+    '''
+    recipe
+        the ingredients as [{'color': string, 'name':string, 'parts':number}]
+        can be set to such a list, or its JSON string, to replace the ingredients
+    '''
+    @property
+    def recipe(self):
+        return [ingredient.long() for ingredient in self.ingredients]
+
+    @recipe.setter
+    def recipe(self, recipe):
+        ingredients = [Ingredient(position=position, **ingredient)
+                       for position, ingredient in enumerate(parse_recipe(recipe))]
+        # loading the current ingredients must not flush pending changes, which update() would then miss
+        with db.session.no_autoflush:
+            self.ingredients = ingredients
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': [ingredient.short() for ingredient in self.ingredients]
         }
 
     '''
@@ -63,7 +273,8 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe,
+            'version': self.version
         }
 
     '''
@@ -95,12 +306,15 @@ class Drink(db.Model):
     update()
         updates a new model into a database
         the model must exist in the database
+        increments the version if the drink or its ingredients changed
         EXAMPLE
             drink = Drink.query.filter(Drink.id == id).one_or_none()
             drink.title = 'Black Coffee'
             drink.update()
     '''
     def update(self):
+        if db.session.is_modified(self):
+            self.version = self.version + 1
         db.session.commit()
 
     def __repr__(self):
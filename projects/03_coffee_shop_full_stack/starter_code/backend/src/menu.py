@@ -0,0 +1,56 @@
+"""In-process cache of the serialized drink menus.
+
+/drinks and /drinks-detail return every drink, and the menu is read far more
+often than it is written. ``MenuCache`` keeps each form of the menu, ``short``
+and ``long``, as the encoded JSON body plus its ETag, so a request for an
+unchanged menu runs no query and no JSON encoding.
+
+A form is rebuilt on the first request after drinks or ingredients are
+written through the ORM (``Drink.insert()``, ``update()``, ``delete()``), or
+after ``ttl`` seconds, which bounds how long writes made by other processes go
+unseen. Anything writing around the ORM should call ``invalidate()``.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from .caching import invalidate_on_write
+
+
+class MenuCache:
+
+    def __init__(self, model, *related_models, ttl=60, clock=time.monotonic):
+        self.model = model
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.generation = 0
+        self._menus = {}
+        for written_model in (model,) + related_models:
+            invalidate_on_write(written_model, self)
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self._menus.clear()
+
+    def get(self, form):
+        """``(body, etag)`` of the menu with every drink as ``drink.short()`` or ``drink.long()``."""
+        now = self.clock()
+        with self.lock:
+            cached = self._menus.get(form)
+            if cached is not None and now - cached[2] < self.ttl:
+                return cached[0], cached[1]
+            generation = self.generation
+        drinks = self.model.query.order_by(self.model.id).all()
+        body = json.dumps({
+            'success': True,
+            'drinks': [getattr(drink, form)() for drink in drinks]
+        }, separators=(',', ':')).encode()
+        etag = hashlib.sha1(body).hexdigest()
+        with self.lock:
+            # a write since the query started makes this body stale already
+            if generation == self.generation:
+                self._menus[form] = (body, etag, now)
+        return body, etag
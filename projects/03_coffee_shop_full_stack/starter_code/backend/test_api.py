@@ -0,0 +1,111 @@
+"""Tests of the drinks API, run from the ./backend directory:
+
+    $ python -m unittest test_api
+
+They run against a throwaway SQLite database file, and without Auth0: token
+verification is replaced by a payload carrying the permissions under test.
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+database_directory = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(database_directory.name, "test.db")}'
+
+from sqlalchemy.orm.exc import StaleDataError
+
+from src import api
+from src.auth.auth import TokenPayload
+from src.database.models import db, db_drop_and_create_all, Drink
+
+HEADERS = {'Authorization': 'Bearer test-token'}
+RECIPE = [{'name': 'espresso', 'color': 'brown', 'parts': 1}]
+
+
+class DrinkUpdateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = api.app.test_client()
+        db_drop_and_create_all()
+        Drink(title='Latte', recipe=RECIPE).insert()
+        db.session.remove()
+        # tokens without exp are never cached, so every request goes through this
+        payload = TokenPayload({'sub': 'manager', 'permissions': ['patch:drinks']})
+        patcher = mock.patch('src.auth.auth.verify_decode_jwt', return_value=payload)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def patch(self, body, drink_id=1, **headers):
+        return self.client.patch(f'/drinks/{drink_id}', json=body, headers=dict(HEADERS, **headers))
+
+    def test_update_title(self):
+        res = self.patch({'title': 'Flat white'})
+        self.assertEqual(res.status_code, 200)
+        drink = res.get_json()['drinks'][0]
+        self.assertEqual((drink['title'], drink['version']), ('Flat white', 2))
+        self.assertEqual(res.headers['ETag'], '"1-2"')
+
+    def test_update_recipe_bumps_version(self):
+        res = self.patch({'recipe': [{'name': 'milk', 'color': 'white', 'parts': 2}]})
+        self.assertEqual(res.status_code, 200)
+        drink = res.get_json()['drinks'][0]
+        self.assertEqual(drink['recipe'], [{'name': 'milk', 'color': 'white', 'parts': 2}])
+        self.assertEqual(drink['version'], 2)
+
+    def test_update_without_changes_keeps_version(self):
+        res = self.patch({'title': 'Latte'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['ETag'], '"1-1"')
+
+    def test_update_if_match(self):
+        res = self.patch({'title': 'Flat white'}, **{'If-Match': '"1-1"'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['ETag'], '"1-2"')
+
+    def test_update_stale_if_match(self):
+        self.patch({'title': 'Flat white'})
+        res = self.patch({'title': 'Cortado'}, **{'If-Match': '"1-1"'})
+        self.assertEqual(res.status_code, 412)
+        self.assertEqual(Drink.query.get(1).title, 'Flat white')
+
+    def test_update_if_match_any(self):
+        self.patch({'title': 'Flat white'})
+        res = self.patch({'title': 'Cortado'}, **{'If-Match': '*'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['ETag'], '"1-3"')
+
+    def test_update_invalid_recipe(self):
+        for recipe in ([{'name': 'milk', 'color': 'white'}], [{'name': 'milk', 'color': 'white', 'parts': 0.5}]):
+            res = self.patch({'recipe': recipe})
+            self.assertEqual(res.status_code, 422)
+        self.assertEqual(Drink.query.get(1).version, 1)
+
+    def test_update_invalid_title(self):
+        for title in (None, 5, ' '):
+            res = self.patch({'title': title})
+            self.assertEqual(res.status_code, 422)
+        self.assertEqual(Drink.query.get(1).version, 1)
+
+    def test_update_non_object_body(self):
+        res = self.patch([1])
+        self.assertEqual(res.status_code, 422)
+
+    def test_update_unknown_drink(self):
+        res = self.patch({'title': 'Flat white'}, drink_id=1000)
+        self.assertEqual(res.status_code, 404)
+
+    def test_update_losing_every_race(self):
+        with mock.patch.object(Drink, 'update', side_effect=StaleDataError) as update:
+            res = self.patch({'title': 'Flat white'})
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(update.call_count, api.PATCH_ATTEMPTS)
+
+    def test_update_losing_race_with_if_match(self):
+        with mock.patch.object(Drink, 'update', side_effect=StaleDataError):
+            res = self.patch({'title': 'Flat white'}, **{'If-Match': '"1-1"'})
+        self.assertEqual(res.status_code, 412)
+
+
+if __name__ == '__main__':
+    unittest.main()
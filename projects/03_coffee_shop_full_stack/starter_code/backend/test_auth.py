@@ -0,0 +1,295 @@
+"""Tests of token handling in src/auth, run from the ./backend directory:
+
+    $ python -m unittest test_auth
+
+Nothing here reaches Auth0.
+"""
+import copy
+import threading
+import time
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from src.auth.auth import AllOf, AnyOf, AuthError, TokenPayload, compile_permission, get_token_auth_header, \
+    requires_auth
+from src.auth.jwks import JWKSKeyStore, JWKSUnavailable, static_provider
+from src.auth.token_cache import ReadOnlyPayload, VerifiedTokenCache
+
+app = Flask(__name__)
+
+
+class AuthHeaderTestCase(unittest.TestCase):
+
+    def token_of(self, header):
+        with app.test_request_context(headers={'Authorization': header} if header is not None else {}):
+            return get_token_auth_header()
+
+    def assertRejected(self, header, code):
+        with self.assertRaises(AuthError) as raised:
+            self.token_of(header)
+        self.assertEqual(raised.exception.status_code, 401)
+        self.assertEqual(raised.exception.error['code'], code)
+
+    def test_bearer_token(self):
+        self.assertEqual(self.token_of('Bearer abc'), 'abc')
+        self.assertEqual(self.token_of('bearer abc'), 'abc')
+
+    def test_missing_header(self):
+        self.assertRejected(None, 'authorization_header_missing')
+        self.assertRejected('', 'authorization_header_missing')
+        self.assertRejected('   ', 'authorization_header_missing')
+
+    def test_malformed_header(self):
+        self.assertRejected('Basic abc', 'invalid_header')
+        self.assertRejected('Bearer', 'invalid_header')
+        self.assertRejected('Bearer abc def', 'invalid_header')
+
+
+def jwks_document(*kids):
+    return {'keys': [{'kty': 'RSA', 'kid': kid, 'use': 'sig', 'n': f'n-{kid}', 'e': 'AQAB'} for kid in kids]}
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingProvider:
+    """Serves ``document``, counting fetches; raises instead while ``document`` is None."""
+
+    def __init__(self, document):
+        self.document = document
+        self.calls = 0
+        self.fetched = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.fetched.set()
+        if self.document is None:
+            raise OSError('key server unreachable')
+        return self.document
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.provider = CountingProvider(jwks_document('a'))
+
+    def store(self, **options):
+        options.setdefault('background', False)
+        return JWKSKeyStore(self.provider, ttl=100, refresh_after=80, min_refetch_interval=30,
+                            clock=self.clock, **options)
+
+    def test_static_provider(self):
+        store = JWKSKeyStore(static_provider(jwks_document('a')))
+        self.assertEqual(store.get_key('a')['n'], 'n-a')
+
+    def test_cache_hit_within_ttl(self):
+        store = self.store()
+        self.assertEqual(store.get_key('a')['kid'], 'a')
+        self.clock.now = 79
+        self.assertEqual(store.get_key('a')['kid'], 'a')
+        self.assertEqual(self.provider.calls, 1)
+
+    def test_refetch_after_ttl(self):
+        store = self.store()
+        store.get_key('a')
+        self.clock.now = 100
+        store.get_key('a')
+        self.assertEqual(self.provider.calls, 2)
+
+    def test_unknown_kid_refetches_at_most_once_per_interval(self):
+        store = self.store()
+        store.get_key('a')
+        self.clock.now = 30
+        self.provider.document = jwks_document('a', 'b')
+        # a rotated key is picked up straight away
+        self.assertEqual(store.get_key('b')['kid'], 'b')
+        self.assertEqual(self.provider.calls, 2)
+        # made-up kids are answered from the cache until the interval has passed
+        for _ in range(5):
+            self.assertIsNone(store.get_key('made-up'))
+        self.assertEqual(self.provider.calls, 2)
+        self.clock.now = 60
+        self.assertIsNone(store.get_key('made-up'))
+        self.assertEqual(self.provider.calls, 3)
+
+    def test_background_refresh_before_expiry(self):
+        store = self.store(background=True)
+        store.get_key('a')
+        self.provider.fetched.clear()
+        self.provider.document = jwks_document('a', 'b')
+        self.clock.now = 80
+        # answered from the cache while the refresh runs
+        self.assertEqual(store.get_key('a')['kid'], 'a')
+        self.assertTrue(self.provider.fetched.wait(5))
+        deadline = time.monotonic() + 5
+        while 'b' not in store.keys and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.provider.calls, 2)
+        self.clock.now = 81
+        self.assertEqual(store.get_key('b')['kid'], 'b')
+        self.assertEqual(self.provider.calls, 2)
+
+    def test_failed_refresh_keeps_keys(self):
+        store = self.store()
+        store.get_key('a')
+        self.provider.document = None
+        self.clock.now = 100
+        self.assertEqual(store.get_key('a')['kid'], 'a')
+
+    def test_unavailable_without_keys(self):
+        self.provider.document = None
+        store = self.store()
+        with self.assertRaises(JWKSUnavailable):
+            store.get_key('a')
+        # still none within the rate limit: unavailable, not an unknown kid
+        with self.assertRaises(JWKSUnavailable):
+            store.get_key('a')
+        self.assertEqual(self.provider.calls, 1)
+        self.provider.document = jwks_document('a')
+        self.clock.now = 30
+        self.assertEqual(store.get_key('a')['kid'], 'a')
+
+
+class VerifiedTokenCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.verified = []
+
+    def verify(self, token):
+        self.verified.append(token)
+        return {'sub': token, 'exp': 100}
+
+    def test_verifies_once_until_exp(self):
+        cache = VerifiedTokenCache(clock=self.clock)
+        first = cache.verify('a', self.verify)
+        self.clock.now = 99
+        self.assertIs(cache.verify('a', self.verify), first)
+        self.assertEqual(self.verified, ['a'])
+        self.clock.now = 100
+        cache.verify('a', self.verify)
+        self.assertEqual(self.verified, ['a', 'a'])
+
+    def test_tokens_without_exp_are_not_cached(self):
+        cache = VerifiedTokenCache(clock=self.clock)
+        for _ in range(2):
+            cache.verify('a', lambda token: self.verified.append(token) or {'sub': token})
+        self.assertEqual(self.verified, ['a', 'a'])
+
+    def test_evicts_least_recently_used(self):
+        cache = VerifiedTokenCache(max_tokens=2, clock=self.clock)
+        for token in ('a', 'b', 'a', 'c'):
+            cache.verify(token, self.verify)
+        self.assertEqual(self.verified, ['a', 'b', 'c'])
+        # b was the least recently used when c came in
+        cache.verify('a', self.verify)
+        cache.verify('b', self.verify)
+        self.assertEqual(self.verified, ['a', 'b', 'c', 'b'])
+
+    def test_max_tokens_zero_disables_cache(self):
+        cache = VerifiedTokenCache(max_tokens=0, clock=self.clock)
+        for _ in range(3):
+            cache.verify('a', self.verify)
+        self.assertEqual(self.verified, ['a', 'a', 'a'])
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_stats(self):
+        cache = VerifiedTokenCache(clock=self.clock)
+        self.assertEqual(cache.stats(), {'size': 0, 'hits': 0, 'misses': 0, 'hit_rate': 0.0})
+        for token in ('a', 'a', 'a', 'b'):
+            cache.verify(token, self.verify)
+        self.assertEqual(cache.stats(), {'size': 2, 'hits': 2, 'misses': 2, 'hit_rate': 0.5})
+
+    def test_payload_is_read_only(self):
+        cache = VerifiedTokenCache(clock=self.clock)
+        payload = cache.verify('a', self.verify)
+        self.assertIsInstance(payload, ReadOnlyPayload)
+        for change in (lambda: payload.__setitem__('sub', 'b'), lambda: payload.update(sub='b'),
+                       lambda: payload.pop('sub'), payload.clear):
+            with self.assertRaises(TypeError):
+                change()
+        self.assertEqual(cache.verify('a', self.verify), {'sub': 'a', 'exp': 100})
+        # copying still works, and dict() gives a copy a view can change
+        self.assertEqual(copy.deepcopy(payload), {'sub': 'a', 'exp': 100})
+        writable = dict(payload)
+        writable['sub'] = 'b'
+
+
+class PermissionTestCase(unittest.TestCase):
+    granted = frozenset({'get:drinks-detail', 'patch:drinks'})
+
+    def allows(self, permission):
+        return compile_permission(permission).allows(self.granted)
+
+    def test_string(self):
+        self.assertEqual(compile_permission('patch:drinks'), AllOf('patch:drinks'))
+        self.assertTrue(self.allows('patch:drinks'))
+        self.assertFalse(self.allows('post:drinks'))
+
+    def test_empty_string(self):
+        self.assertTrue(self.allows(''))
+
+    def test_list_requires_all(self):
+        self.assertEqual(compile_permission(['patch:drinks', 'post:drinks']), AllOf('patch:drinks', 'post:drinks'))
+        self.assertTrue(self.allows(['get:drinks-detail', 'patch:drinks']))
+        self.assertFalse(self.allows(['patch:drinks', 'post:drinks']))
+
+    def test_any_of(self):
+        self.assertTrue(self.allows(AnyOf('post:drinks', 'patch:drinks')))
+        self.assertFalse(self.allows(AnyOf('post:drinks', 'delete:drinks')))
+        self.assertFalse(self.allows(AnyOf()))
+
+    def test_nested(self):
+        self.assertTrue(self.allows(AllOf('get:drinks-detail', AnyOf('post:drinks', 'patch:drinks'))))
+        self.assertFalse(self.allows(AllOf('get:drinks-detail', AnyOf('post:drinks', 'delete:drinks'))))
+        self.assertTrue(self.allows(AnyOf('delete:drinks', AllOf('get:drinks-detail', 'patch:drinks'))))
+        self.assertFalse(self.allows(AnyOf('delete:drinks', AllOf('get:drinks-detail', 'post:drinks'))))
+        self.assertTrue(self.allows([AnyOf('post:drinks', 'patch:drinks'), 'get:drinks-detail']))
+
+    def test_expressions_of_the_same_permissions_differ(self):
+        self.assertNotEqual(AllOf('a', 'b'), AnyOf('a', 'b'))
+        self.assertEqual(len(AllOf(AllOf('a', 'b'), AnyOf('a', 'b')).nested), 2)
+
+
+class RequiresAuthTestCase(unittest.TestCase):
+
+    def setUp(self):
+        payload = TokenPayload({'sub': 'barista', 'permissions': ['get:drinks-detail']})
+        patcher = mock.patch('src.auth.auth.verify_decode_jwt', return_value=payload)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def call(self, permission):
+        view = requires_auth(permission)(lambda payload: payload['sub'])
+        with app.test_request_context(headers={'Authorization': 'Bearer test-token'}):
+            return view()
+
+    def test_allowed(self):
+        self.assertEqual(self.call('get:drinks-detail'), 'barista')
+        self.assertEqual(self.call(AnyOf('patch:drinks', 'get:drinks-detail')), 'barista')
+
+    def test_forbidden(self):
+        for permission in ('patch:drinks', ['get:drinks-detail', 'patch:drinks'],
+                           AllOf('get:drinks-detail', AnyOf('patch:drinks', 'post:drinks'))):
+            with self.assertRaises(AuthError) as raised:
+                self.call(permission)
+            self.assertEqual(raised.exception.status_code, 403)
+
+    def test_no_permissions_claim(self):
+        with mock.patch('src.auth.auth.verify_decode_jwt', return_value=TokenPayload({'sub': 'barista'})):
+            with self.assertRaises(AuthError) as raised:
+                self.call('get:drinks-detail')
+        self.assertEqual(raised.exception.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()